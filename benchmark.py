@@ -0,0 +1,294 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+import multiprocessing.forkserver
+from PIL import Image, ImageDraw
+
+from composite import frame_save_params
+from bundle import FRAME_FORMATS
+from sync import pdf_scale
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (label, format, quality, png compress level)
+ENCODER_OPTIONS = [
+    ("png-6", "png", None, 6),
+    ("png-1", "png", None, 1),
+    ("png-0", "png", None, 0),
+    ("jpeg-90", "jpeg", 90, None),
+    ("jpeg-80", "jpeg", 80, None),
+    ("webp-85", "webp", 85, None),
+    ("ppm", "ppm", None, None),
+]
+
+# Sizes seen on the share: phone photos both ways, screenshots, A4 scans, small posters
+IMAGE_SIZES = [(4032, 3024), (3024, 4032), (1920, 1080), (1080, 1920), (2480, 3508), (800, 600), (1200, 1200)]
+PDF_PAGE_SIZE = (1240, 1754)  # A4 at 150 DPI
+
+# =====================================================================================
+# Frame encoders
+
+def sample_frame(path=None, size=(2400, 1200)):
+    """A real composite when one is given, else a synthetic frame with text-like detail."""
+    if path:
+        with Image.open(path) as img:
+            return img.convert('RGB')
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    noise = Image.effect_noise(size, 40).convert('RGB')
+    return Image.blend(img, noise, 0.3)
+
+def bench_encoder(img, frame_format, params, repeat):
+    encode = decode = 0.0
+    size = 0
+    for _ in range(repeat):
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        img.save(buffer, format=frame_format.upper(), **params)
+        encode += time.perf_counter() - start
+        size = buffer.tell()
+
+        buffer.seek(0)
+        start = time.perf_counter()
+        with Image.open(buffer) as decoded:
+            decoded.load()
+        decode += time.perf_counter() - start
+    return encode / repeat, decode / repeat, size
+
+def run_encoders(frame_path=None, repeat=3):
+    img = sample_frame(frame_path)
+    print(f"Frame {img.width}x{img.height}, {repeat} run(s) per option")
+    print(f"{'option':<10}{'encode ms':>12}{'decode ms':>12}{'KiB/frame':>12}")
+    results = []
+    for label, frame_format, quality, compress_level in ENCODER_OPTIONS:
+        params = frame_save_params(frame_format, quality, compress_level)
+        encode, decode, size = bench_encoder(img, frame_format, params, repeat)
+        print(f"{label:<10}{encode * 1000:>12.1f}{decode * 1000:>12.1f}{size / 1024:>12.0f}")
+        results.append({"option": label, "format": frame_format, "extension": FRAME_FORMATS[frame_format],
+                        "encode_s": encode, "decode_s": decode, "bytes": size})
+    return results
+
+# =====================================================================================
+# Synthetic corpus
+
+def synthetic_image(size, rng):
+    """A photo-like image: a gradient with a few shapes, so encoders have real work to do."""
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        r = rng.randrange(20, max(21, min(size) // 4))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    return img
+
+def calendar_html(count):
+    items = []
+    for i in range(count):
+        items.append(
+            '<div class="hh-calendar-content">'
+            f'<span class="hh-calendar-date-day">{i + 1}</span>'
+            '<span class="hh-calendar-date-month">Oct</span>'
+            f'<h3 class="hh-calendar-heading">Seminar number {i + 1} on a topic with a long title</h3>'
+            f'<p class="hh-calendar-text">{"Room, speaker and a short abstract of the talk. " * 4}</p>'
+            '</div>')
+    # Padding around the events, like the navigation and footer of the real page
+    filler = "<div class='nav'>" + "<a href='#'>link</a>" * 500 + "</div>"
+    return f"<html><body>{filler}{''.join(items)}{filler}</body></html>"
+
+def make_corpus(root, images=20, pdfs=2, pdf_pages=5, events=8, seed=1):
+    """Write left/ and right/ with images and PDFs, a zipped copy of them and the calendar page."""
+    rng = random.Random(seed)
+    share = os.path.join(root, "Share")
+    for side in ("left", "right"):
+        folder = os.path.join(share, side)
+        os.makedirs(folder)
+        for i in range(images):
+            size = IMAGE_SIZES[rng.randrange(len(IMAGE_SIZES))]
+            ext = rng.choice(('.jpg', '.png'))
+            synthetic_image(size, rng).save(os.path.join(folder, f"{side}-{i:03d}{ext}"))
+        for i in range(pdfs):
+            pages = [synthetic_image(PDF_PAGE_SIZE, rng) for _ in range(pdf_pages)]
+            pages[0].save(os.path.join(folder, f"{side}-doc{i}.pdf"), save_all=True,
+                          append_images=pages[1:], resolution=150)
+
+    zip_path = os.path.join(root, "share.zip")
+    with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+        for side in ("left", "right"):
+            for name in sorted(os.listdir(os.path.join(share, side))):
+                zip_ref.write(os.path.join(share, side, name), f"Share/{side}/{name}")
+
+    with open(os.path.join(root, "calendar.html"), 'w') as f:
+        f.write(calendar_html(events))
+    return share, zip_path
+
+# =====================================================================================
+# Stages, each run in a fresh process so peak RSS belongs to that stage alone
+
+def tree_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for folder, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(folder, name))
+    return total
+
+def _run_stage(workdir, fn, args, output, conn):
+    os.chdir(workdir)
+    # Stage output is noise here, the numbers are what matter
+    sys.stdout = open(os.devnull, 'w')
+    before = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    start = time.perf_counter()
+    error = None
+    try:
+        fn(*args)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - start
+    # Render workers are children of the forkserver, stopping it reaps their usage into ours
+    stop_forkserver = getattr(multiprocessing.forkserver._forkserver, "_stop", None)
+    if stop_forkserver:
+        stop_forkserver()
+    after = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    # Children covers pdftoppm and the render pool
+    cpu = sum(a.ru_utime + a.ru_stime - b.ru_utime - b.ru_stime for a, b in zip(after, before))
+    conn.send({
+        "ok": error is None,
+        "error": error,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "peak_rss_kb": max(usage.ru_maxrss for usage in after),
+        "bytes_written": tree_size(output) if os.path.exists(output) else 0,
+    })
+
+def measure(name, workdir, fn, args=(), output="."):
+    """Run fn(*args) inside workdir in a child process and collect its resource usage."""
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe(duplex=False)
+    process = context.Process(target=_run_stage, args=(workdir, fn, args, output, child))
+    process.start()
+    child.close()
+    try:
+        result = parent.recv()
+    except EOFError:
+        result = {"ok": False, "error": "stage process died"}
+    process.join()
+    result = {"stage": name, **result}
+    status = "ok" if result["ok"] else result["error"]
+    print(f"{name:<12}{result.get('wall_s', 0):>10.2f}{result.get('cpu_s', 0):>10.2f}"
+          f"{result.get('peak_rss_kb', 0) / 1024:>10.0f}{result.get('bytes_written', 0) / 2**20:>10.1f}  {status}")
+    return result
+
+def stage_ingest(zip_path):
+    from ingest import ingest_zip
+    ingest_zip(zip_path, os.path.join("downloads", "incoming"))
+
+def stage_process(pdf_options):
+    # What refresh_content runs, incoming is used up like after a real download
+    from sync import sync_folders, MANIFEST_FILE
+    sync_folders(os.path.join("downloads", "incoming"), os.path.join("downloads", "extracted"),
+                 os.path.join("downloads", MANIFEST_FILE), pdf_options=pdf_options)
+    shutil.rmtree(os.path.join("downloads", "incoming"))
+
+def stage_calendar(html_path, size):
+    from hhcalendar import parse_events, normalize_events, create_calendar_image
+    with open(html_path) as f:
+        events = normalize_events(parse_events(f.read()))
+    create_calendar_image(events, os.path.join("downloads", "calendar.png"), size=size)
+
+def stage_composite(workers, frame_format, frame_size):
+    from composite import create_composite
+    create_composite(workers, frame_format, frame_size=frame_size)
+
+def run_pipeline(args):
+    """Build a corpus and time ingest, PDF processing, calendar and composite on it.
+
+    The ingest, process and composite stages then run a second time on the
+    same share, like a refresh where nothing changed.
+    """
+    root = tempfile.mkdtemp(prefix="campuspulse-bench-")
+    try:
+        print(f"Building corpus in {root}")
+        share, zip_path = make_corpus(os.path.join(root, "corpus"), args.images, args.pdfs, args.pdf_pages,
+                                      args.events, args.seed)
+        workdir = os.path.join(root, "work")
+        os.makedirs(os.path.join(workdir, "home"))
+        shutil.copy(os.path.join(REPO_DIR, "home", "home.png"), os.path.join(workdir, "home", "home.png"))
+
+        frame_size = tuple(args.frame_size) if args.frame_size else None
+        calendar_size = (frame_size[0] // 3, frame_size[1]) if frame_size else None
+        pdf_options = {"scale": pdf_scale(frame_size), "max_pages": args.pdf_max_pages, "workers": args.workers}
+
+        print(f"{'stage':<12}{'wall s':>10}{'cpu s':>10}{'rss MiB':>10}{'out MiB':>10}")
+        return [
+            measure("ingest", workdir, stage_ingest, (zip_path,), "downloads/incoming"),
+            measure("process", workdir, stage_process, (pdf_options,), "downloads/extracted"),
+            measure("calendar", workdir, stage_calendar, (os.path.join(root, "corpus", "calendar.html"),
+                                                          calendar_size), "downloads/calendar.png"),
+            measure("composite", workdir, stage_composite, (args.workers, args.frame_format, frame_size),
+                    "downloads/extracted/comps"),
+            # Unchanged share: files are only hashed, PDF pages come from the cache, no frame is redrawn
+            measure("reingest", workdir, stage_ingest, (zip_path,), "downloads/incoming"),
+            measure("resync", workdir, stage_process, (pdf_options,), "downloads/extracted"),
+            measure("recomposite", workdir, stage_composite, (args.workers, args.frame_format, frame_size),
+                    "downloads/extracted/comps"),
+        ]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def git_version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the refresh pipeline and frame encoders.")
+    parser.add_argument("--suite", choices=("all", "pipeline", "encoders"), default="all")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--frame", help="Composite to encode, defaults to a synthetic 2400x1200 frame")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--images", type=int, default=20, help="Images per side")
+    parser.add_argument("--pdfs", type=int, default=2, help="PDFs per side")
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--pdf-max-pages", type=int, default=0)
+    parser.add_argument("--events", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--frame-format", choices=sorted(FRAME_FORMATS), default="png")
+    parser.add_argument("--frame-size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.frame and not os.path.isfile(args.frame):
+        parser.error(f"{args.frame} does not exist")
+
+    results = {
+        "version": git_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        # Without it PDFs are dropped and the process stage only renames images
+        "pdftoppm": shutil.which("pdftoppm") is not None,
+        "options": vars(args),
+    }
+    if args.suite in ("all", "pipeline"):
+        results["stages"] = run_pipeline(args)
+    if args.suite in ("all", "encoders"):
+        results["encoders"] = run_encoders(args.frame, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"Results written to {args.output}")
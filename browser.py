@@ -0,0 +1,67 @@
+import os
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from downloader import browser_lock
+
+# Kept outside downloads/ so clearing a refresh does not throw away the warm profile
+PROFILE_DIR = os.path.join(os.getcwd(), "cache", "chromium-profile")
+CACHE_DIR = os.path.join(os.getcwd(), "cache", "chromium-cache")
+
+_driver = None
+_download_dir = None
+
+def set_download_dir(driver, download_dir):
+    # Headless Chromium only honours a new download folder through DevTools
+    driver.command_executor._commands["send_command"] = ("POST", "/session/$sessionId/chromium/send_command")
+    driver.execute("send_command", {
+        "cmd": "Page.setDownloadBehavior",
+        "params": {"behavior": "allow", "downloadPath": download_dir},
+    })
+
+def get_driver(download_dir=None):
+    """Borrow the shared headless Chromium, launching it on first use in a refresh cycle."""
+    global _driver, _download_dir
+    if _driver is None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        chrome_options = Options()
+        if download_dir:
+            chrome_options.add_experimental_option("prefs", {
+                "download.default_directory": download_dir,
+                "download.prompt_for_download": False,
+                "download.directory_upgrade": True,
+                "safebrowsing.enabled": True
+            })
+        chrome_options.add_argument("--headless=new")  # Comment out for debug
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument(f"--user-data-dir={PROFILE_DIR}")
+        chrome_options.add_argument(f"--disk-cache-dir={CACHE_DIR}")
+        print("Starting shared browser")
+        _driver = webdriver.Chrome(options=chrome_options)
+        _download_dir = download_dir
+    elif download_dir and download_dir != _download_dir:
+        set_download_dir(_driver, download_dir)
+        _download_dir = download_dir
+    return _driver
+
+def close_driver(timeout=None):
+    """Quit the shared browser, safe to call when none is running.
+
+    Waits for whoever is driving it, such as a source that ran past its
+    deadline, to finish first. After timeout seconds it is quit anyway.
+    """
+    global _driver, _download_dir
+    locked = browser_lock.acquire(timeout=-1 if timeout is None else timeout)
+    try:
+        if _driver is not None:
+            try:
+                _driver.quit()
+                print("Shared browser closed")
+            except Exception as e:
+                print(f"Error closing browser: {e}")
+            _driver = None
+            _download_dir = None
+    finally:
+        if locked:
+            browser_lock.release()
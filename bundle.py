@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import shutil
+
+from sync import link_or_copy
+
+BUNDLE_ROOT = "bundles"
+BUNDLE_FILE = "bundle.json"
+CURRENT_LINK = "current"
+KEEP_BUNDLES = 2
+
+# Output format name -> file extension of the frames
+FRAME_FORMATS = {
+    'png': '.png',
+    'jpeg': '.jpg',
+    'webp': '.webp',
+    'ppm': '.ppm',  # Uncompressed, fastest to write and to decode
+}
+# What the players pick up from a frames folder, .jpeg for frames made by hand
+FRAME_EXTENSIONS = tuple(FRAME_FORMATS.values()) + ('.jpeg',)
+
+def link_tree(src, dst):
+    """Mirror the files of src into dst."""
+    os.makedirs(dst, exist_ok=True)
+    for name in os.listdir(src):
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+        if os.path.isdir(src_path):
+            link_tree(src_path, dst_path)
+        else:
+            link_or_copy(src_path, dst_path)
+
+def current_bundle(root=BUNDLE_ROOT):
+    """Path of the last-known-good bundle, None before the first successful refresh."""
+    path = os.path.join(root, CURRENT_LINK)
+    if os.path.isfile(os.path.join(path, BUNDLE_FILE)):
+        return os.path.realpath(path)
+    return None
+
+def read_bundle(path):
+    with open(os.path.join(path, BUNDLE_FILE)) as f:
+        return json.load(f)
+
+def publish_bundle(frames_dir, mode, inputs=None, root=BUNDLE_ROOT, source=None):
+    """Snapshot a finished render as a new bundle and make it the current one.
+
+    frames_dir holds what the slideshow plays (comps or columns), inputs maps
+    names to the files or folders it was rendered from. source is the version
+    on the render node when the frames came from one. Nothing is visible
+    under the current link until the bundle is complete.
+    """
+    os.makedirs(root, exist_ok=True)
+    version = time.strftime("%Y%m%d-%H%M%S")
+    n = 0
+    while os.path.exists(os.path.join(root, version if not n else f"{version}-{n}")):
+        n += 1
+    if n:
+        version = f"{version}-{n}"
+
+    tmp_path = os.path.join(root, version + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    link_tree(frames_dir, os.path.join(tmp_path, "frames"))
+    for name, src in (inputs or {}).items():
+        if os.path.isdir(src):
+            link_tree(src, os.path.join(tmp_path, "inputs", name))
+        elif os.path.isfile(src):
+            os.makedirs(os.path.join(tmp_path, "inputs"), exist_ok=True)
+            link_or_copy(src, os.path.join(tmp_path, "inputs", name))
+
+    frames = sorted(os.listdir(os.path.join(tmp_path, "frames")))
+    info = {"version": version, "mode": mode, "created": time.time(), "frames": frames}
+    if source:
+        info["source"] = source
+    with open(os.path.join(tmp_path, BUNDLE_FILE), "w") as f:
+        json.dump(info, f, indent=1)
+
+    bundle_path = os.path.join(root, version)
+    os.rename(tmp_path, bundle_path)
+
+    # Flip the current link atomically, readers see either the old or the new bundle
+    tmp_link = os.path.join(root, CURRENT_LINK + ".tmp")
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(version, tmp_link)
+    os.replace(tmp_link, os.path.join(root, CURRENT_LINK))
+    print(f"Published slide bundle {version} ({len(frames)} frames)")
+
+    prune_bundles(root)
+    return bundle_path
+
+def prune_bundles(root=BUNDLE_ROOT, keep=KEEP_BUNDLES):
+    current = os.path.basename(current_bundle(root) or "")
+    versions = sorted(name for name in os.listdir(root)
+                      if os.path.isfile(os.path.join(root, name, BUNDLE_FILE)) and name != CURRENT_LINK)
+    for name in versions[:-keep]:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    # Leftovers from a publish that was interrupted
+    for name in os.listdir(root):
+        if name.endswith(".tmp") and os.path.isdir(os.path.join(root, name)):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
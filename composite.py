@@ -1,9 +1,319 @@
 import os
+import json
 import math
+import shutil
+import hashlib
+import resource
 from PIL import Image
 import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from slideshow import fit_to_screen
+from metrics import peak_rss_bytes
+from bundle import FRAME_FORMATS, FRAME_EXTENSIONS
 
-def create_composite():
+CELL_BG = '#E3EDF5'
+FRAMES_INDEX = 'frames.json'
+COLUMNS_INDEX = 'columns.json'
+
+
+# Resized side images, keyed by (path, mtime, cell size, side), and finished
+# cells, keyed by ('cell', image key, position), least recently used first.
+# Only kept while one render runs, clear_cache() frees it between refreshes
+_cell_cache = {}
+_cell_cache_bytes = 0
+# Byte cap on the cache under a memory budget, None for no cap
+_cell_cache_limit = None
+
+# Address space of a render worker before its first frame (interpreter, PIL and
+# its decoders, allocator slack) in MB, measured from a forkserver worker
+WORKER_BASE_MB = 70
+
+# Calendar image loaded once per pool worker
+_worker_calendar = None
+
+# (calendar image, layout, frame background with the calendar pasted in)
+_template = None
+
+def save_atomic(img, path, **params):
+    """Save through a temp file and rename, so readers (and hard-linked
+    snapshots of the old file) never see a half-written image."""
+    tmp_path = path + '.tmp'
+    img.save(tmp_path, format=Image.registered_extensions()[os.path.splitext(path)[1].lower()], **params)
+    os.replace(tmp_path, path)
+
+def frame_save_params(frame_format='png', quality=90, compress_level=6):
+    """Encoder settings for PIL's save() for one of FRAME_FORMATS."""
+    if frame_format == 'png':
+        return {'compress_level': compress_level}
+    if frame_format in ('jpeg', 'webp'):
+        return {'quality': quality}
+    return {}
+
+def fit_size(img_width, img_height, side_width, side_height):
+    """Return the (width, height) an image is scaled to inside a side cell."""
+    img_aspect = img_width / img_height
+
+    if img_height > img_width:  # Portrait
+        # For portrait, fit by height
+        new_height = side_height
+        new_width = int(new_height * img_aspect)
+        if new_width > side_width:
+            new_width = side_width
+            new_height = int(new_width / img_aspect)
+    else:  # Landscape
+        # For landscape, fit by width
+        new_width = side_width
+        new_height = int(new_width / img_aspect)
+        if new_height > side_height:
+            new_height = side_height
+            new_width = int(new_height * img_aspect)
+    return new_width, new_height
+
+def image_bytes(img):
+    # PIL keeps every multi-band mode (RGB included) at 4 bytes per pixel
+    return img.width * img.height * (4 if len(img.getbands()) > 1 else 1)
+
+def open_for_cell(img_path, side_width, side_height):
+    """Open an image set up to decode no larger than its cell needs.
+
+    Only the header is read here. JPEGs are switched to DCT scaling, so a
+    6000x4000 photo decodes at 1/2, 1/4 or 1/8 size instead of in full.
+    """
+    img = Image.open(img_path)
+    target = fit_size(img.width, img.height, side_width, side_height)
+    img.draft('RGB', target)
+    return img, target
+
+def decoded_bytes(img_path, side_width, side_height):
+    """Memory the decode of a side image takes, from its header only."""
+    img, _ = open_for_cell(img_path, side_width, side_height)
+    with img:
+        return image_bytes(img)
+
+def cache_get(key):
+    img = _cell_cache.pop(key, None)
+    if img is not None:
+        # Move to the most recently used end
+        _cell_cache[key] = img
+    return img
+
+def cache_put(key, img):
+    global _cell_cache_bytes
+    _cell_cache[key] = img
+    _cell_cache_bytes += image_bytes(img)
+    if _cell_cache_limit is not None:
+        while _cell_cache_bytes > _cell_cache_limit and len(_cell_cache) > 1:
+            oldest = next(iter(_cell_cache))
+            _cell_cache_bytes -= image_bytes(_cell_cache.pop(oldest))
+    return img
+
+def fitted_key(img_path, side, side_width, side_height):
+    return (img_path, os.path.getmtime(img_path), (side_width, side_height), side)
+
+def get_fitted_image(img_path, side, side_width, side_height):
+    """Decode and resize a side image once, then serve it from the cache."""
+    key = fitted_key(img_path, side, side_width, side_height)
+    fitted = cache_get(key)
+    if fitted is None:
+        img, (new_width, new_height) = open_for_cell(img_path, side_width, side_height)
+        with img:
+            fitted = cache_put(key, img.resize((new_width, new_height), Image.LANCZOS, reducing_gap=3.0))
+    return fitted
+
+def place_pair(composite, pair, side, x_offset, side_width, side_height):
+    """Paste a pair of images as two stacked cells starting at x_offset."""
+    calendar_height = side_height * 2
+    BORDER_PADDING = round(25 * calendar_height / 1200)  # 25px on the original 1200px tall frame
+
+    fitted = [get_fitted_image(p, side, side_width, side_height) for p in pair]
+    two_image_height = sum(img.height for img in fitted)
+    make_space = (calendar_height - two_image_height)//3
+
+    for i, (img_path, resized_img) in enumerate(zip(pair, fitted)):
+        new_width, new_height = resized_img.size
+
+        # Calculate position (top image aligned to top, bottom image aligned to bottom)
+        if side == 'left':
+            x_pos = BORDER_PADDING + (side_width - new_width) // 2
+        else:
+            x_pos = (side_width - new_width) // 2 - BORDER_PADDING
+        y_pos = 0 + make_space if i == 0 else side_height - new_height - make_space  # Top for first image, bottom for second
+
+        # The same image lands at the same spot in many frames, build its cell once
+        cell_key = ('cell', fitted_key(img_path, side, side_width, side_height), x_pos, y_pos)
+        cell_bg = cache_get(cell_key)
+        if cell_bg is None:
+            # Create a white background for this cell
+            cell_bg = Image.new('RGB', (side_width, side_height), CELL_BG)
+            # Paste the resized image onto the white background
+            cell_bg.paste(resized_img, (x_pos, y_pos))
+            cache_put(cell_key, cell_bg)
+        # Paste the cell onto the composite
+        composite.paste(cell_bg, (x_offset, i * side_height))
+
+def make_pairs(images, home_path):
+    """Group side images in twos, padding an odd tail or an empty side with home."""
+    pairs = []
+    for i in range(0, len(images), 2):
+        if i + 1 < len(images):
+            pairs.append([images[i], images[i+1]])
+        else:
+            pairs.append([images[i], home_path])
+
+    # If the folder is empty, use home.jpg
+    if not pairs:
+        pairs.append([home_path, home_path])
+    return pairs
+
+def frame_layout(calendar_img, frame_size=None):
+    """Column widths (left, center, right) and height of a frame.
+
+    Without a frame size the frame is three calendar widths wide, as before.
+    """
+    if frame_size is None:
+        return (calendar_img.width,) * 3, calendar_img.height
+    width, height = frame_size
+    column = width // 3
+    return (column, column, width - 2 * column), height
+
+def fit_calendar(calendar_img, frame_size=None):
+    """Make the calendar exactly the center column, in case it was drawn at another size."""
+    (_, center_width, _), height = frame_layout(calendar_img, frame_size)
+    if calendar_img.size != (center_width, height):
+        calendar_img = calendar_img.convert('RGB').resize((center_width, height), Image.LANCZOS)
+    return calendar_img
+
+def fit_home(home_img, frame_size=None):
+    # The home slide is letterboxed like the player would, but only once
+    if frame_size is None:
+        return home_img
+    return fit_to_screen(home_img, frame_size)
+
+def render_column(pair, side, side_width, calendar_height):
+    """Render one side column (two stacked cells) as a standalone image."""
+    column = Image.new('RGB', (side_width, calendar_height), 'white')
+    place_pair(column, pair, side, 0, side_width, calendar_height // 2)
+    return column
+
+def clear_cache():
+    # Hours pass until the next refresh, the display should not hold the cells meanwhile
+    global _cell_cache_bytes, _template
+    _cell_cache.clear()
+    _cell_cache_bytes = 0
+    _template = None
+
+def frame_template(calendar_img, frame_size=None):
+    """The part of every frame that never changes: background and calendar, built once."""
+    global _template
+    layout = frame_layout(calendar_img, frame_size)
+    if _template is None or _template[0] is not calendar_img or _template[1] != layout:
+        (left_width, center_width, right_width), calendar_height = layout
+        # Width = left column + center column + right column
+        template = Image.new('RGB', (left_width + center_width + right_width, calendar_height), 'white')
+        # Place the calendar in the center
+        template.paste(calendar_img, (left_width, 0))
+        _template = (calendar_img, layout, template)
+    return _template[2]
+
+def render_frame(calendar_img, left_pair, right_pair, frame_size=None):
+    """Build one full frame: left column, calendar in the center, right column.
+
+    calendar_img must already be the size of the center column (fit_calendar).
+    """
+    (left_width, center_width, right_width), calendar_height = frame_layout(calendar_img, frame_size)
+    side_height = calendar_height // 2
+
+    composite = frame_template(calendar_img, frame_size).copy()
+
+    # Process and place left and right images
+    place_pair(composite, left_pair, 'left', 0, left_width, side_height)
+    place_pair(composite, right_pair, 'right', left_width + center_width, right_width, side_height)
+    return composite
+
+def limit_memory(limit_bytes):
+    """Cap the whole address space of this process at limit_bytes.
+
+    Allocations past the cap raise MemoryError instead of pushing the board
+    into swap. Only ever called in render workers, which start clean from the
+    forkserver (WORKER_BASE_MB of address space), never in the display process.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        current = 0
+    if current > limit_bytes:
+        print(f"Render worker already uses {current // 2**20} MB, over its {limit_bytes // 2**20} MB share")
+    resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+def plan_memory(memory_mb, workers, jobs, calendar_path, frame_size=None):
+    """Split a memory budget over render workers, sized from image headers only.
+
+    Returns (workers, bytes per worker, cell cache cap per worker).
+    """
+    with Image.open(calendar_path) as calendar_img:
+        widths, height = frame_layout(calendar_img, frame_size)
+    frame = sum(widths) * height * 4
+    paths = {path for job in jobs for path in job[1] + job[2]}
+    peak_decode = max((decoded_bytes(path, max(widths[0], widths[2]), height // 2) for path in paths), default=0)
+    # A frame being built and encoded, the calendar and the largest decode in flight
+    fixed = WORKER_BASE_MB * 2**20 + 2 * frame + widths[1] * height * 4 + peak_decode
+    budget = memory_mb * 2**20
+    workers = max(1, min(workers, budget // fixed))
+    share = budget // workers
+    if share < fixed:
+        print(f"Memory budget of {memory_mb} MB is below the estimated {fixed // 2**20} MB for one worker")
+    # Freed decodes leave holes in the heap, so the cache only gets half of what is left
+    return workers, share, max(0, (share - fixed) // 2)
+
+def _init_worker(calendar_path, frame_size, memory_limit=None, cache_limit=None):
+    global _worker_calendar, _cell_cache_limit
+    if memory_limit:
+        limit_memory(memory_limit)
+    _cell_cache_limit = cache_limit
+    with Image.open(calendar_path) as calendar_img:
+        calendar_img.load()
+        _worker_calendar = fit_calendar(calendar_img, frame_size)
+
+def _render_job(job):
+    """Render one frame in a pool worker, returns the worker's peak RSS so far."""
+    output_path, left_pair, right_pair, save_params, frame_size = job
+    try:
+        save_atomic(render_frame(_worker_calendar, left_pair, right_pair, frame_size=frame_size),
+                    output_path, **save_params)
+    except MemoryError:
+        raise MemoryError(f"{output_path} does not fit in the render memory budget") from None
+    return peak_rss_bytes()
+
+def frame_signature(paths, settings=""):
+    """Identify a frame by the files it is built from, without reading them."""
+    parts = [settings]
+    for path in paths:
+        st = os.stat(path)
+        parts.append(f"{path}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+def load_inputs(left_dir, right_dir, home_path):
+    # Get all image files from left and right directories
+    left_images = [os.path.join(left_dir, f) for f in sorted(os.listdir(left_dir)) 
+                  if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    right_images = [os.path.join(right_dir, f) for f in sorted(os.listdir(right_dir)) 
+                   if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+
+    # Group images into pairs (if odd, last group will have home.jpg)
+    return make_pairs(left_images, home_path), make_pairs(right_images, home_path)
+
+def create_composite(workers=1, frame_format='png', quality=90, compress_level=6, frame_size=None,
+                     memory_mb=0, pools=None):
+    """Render every frame, at frame_size (the screen resolution) when given.
+
+    With memory_mb set, rendering runs in worker processes that together stay
+    under that many megabytes, fewer workers are used if needed. The process
+    pool is added to pools (a list) while it runs, so the caller can cancel
+    it. Returns the number of frames redrawn or removed and the peak RSS of
+    the largest worker, 0 when rendering ran in this process.
+    """
     output_dir = 'downloads/extracted/comps'
     os.makedirs(output_dir, exist_ok=True)
     
@@ -13,55 +323,39 @@ def create_composite():
     calendar_path = 'downloads/calendar.png'
     home_path = 'home/home.png'
 
-    BORDER_PADDING = 25
-    
-    # Get all image files from left and right directories
-    left_images = [os.path.join(left_dir, f) for f in sorted(os.listdir(left_dir)) 
-                  if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    right_images = [os.path.join(right_dir, f) for f in sorted(os.listdir(right_dir)) 
-                   if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    
-    # Load the calendar and home images
-    calendar_img = Image.open(calendar_path)
-    home_img = Image.open(home_path)
+    left_pairs, right_pairs = load_inputs(left_dir, right_dir, home_path)
     
+    # Signatures of the frames already on disk, unchanged ones are not redrawn.
+    # Kept next to the frames folder so the slideshow never tries to show it
+    index_path = os.path.join(os.path.dirname(output_dir), FRAMES_INDEX)
+    try:
+        with open(index_path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+    frames = {}
+
+    ext = FRAME_FORMATS[frame_format]
+    save_params = frame_save_params(frame_format, quality, compress_level)
+    # Changing the encoder settings must redraw every frame
+    settings = f"{frame_format}:{sorted(save_params.items())}:{frame_size}"
+
     # First image is just the home image
-    home_img.save(os.path.join(output_dir, '1.png'))
+    home_name = f'1{ext}'
+    frames[home_name] = frame_signature([home_path], settings)
+    changed = 0
+    if previous.get(home_name) != frames[home_name] or not os.path.exists(os.path.join(output_dir, home_name)):
+        changed += 1
+        with Image.open(home_path) as home_img:
+            home_img = fit_home(home_img, frame_size)
+            if frame_format in ('jpeg', 'ppm') and home_img.mode != 'RGB':
+                # No alpha channel in these formats
+                home_img = home_img.convert('RGB')
+            save_atomic(home_img, os.path.join(output_dir, home_name), **save_params)
     
     # Create all possible combinations of left and right images (in groups of 2)
     image_count = 2  # Start numbering from 2 since 1 is home
     
-    # Group left images into pairs (if odd, last group will have home.jpg)
-    left_pairs = []
-    for i in range(0, len(left_images), 2):
-        if i + 1 < len(left_images):
-            left_pairs.append([left_images[i], left_images[i+1]])
-        else:
-            left_pairs.append([left_images[i], home_path])
-    
-    # If left folder is empty, use home.jpg
-    if not left_pairs:
-        left_pairs.append([home_path, home_path])
-    
-    # Group right images into pairs (if odd, last group will have home.jpg)
-    right_pairs = []
-    for i in range(0, len(right_images), 2):
-        if i + 1 < len(right_images):
-            right_pairs.append([right_images[i], right_images[i+1]])
-        else:
-            right_pairs.append([right_images[i], home_path])
-    
-    # If right folder is empty, use home.jpg
-    if not right_pairs:
-        right_pairs.append([home_path, home_path])
-    
-    # Get calendar dimensions for reference
-    calendar_width = calendar_img.width
-    calendar_height = calendar_img.height
-    
-    # Calculate the ideal height for each side image (half of calendar height)
-    side_height = calendar_height // 2
-
     lcm_count = math.lcm(len(left_pairs), len(right_pairs))
     left_repeat = lcm_count // len(left_pairs)
     right_repeat = lcm_count // len(right_pairs)
@@ -81,150 +375,164 @@ def create_composite():
     for i in range(lcm_count):
         combinations.append((expanded_left_pairs[i], expanded_right_pairs[i]))
     
-    # Generate all combinations of left and right pairs
+    # Every frame gets its final name up front so the output order is fixed
+    jobs = []
     for left_pair, right_pair in combinations:
-        # Create a new blank image
-        # Width = left column + center column + right column
-        composite_width = calendar_width * 3  # Equal width for all columns
-        composite_height = calendar_height
-        composite = Image.new('RGB', (composite_width, composite_height), 'white')
-        
-        # Place the calendar in the center
-        calendar_x = calendar_width
-        composite.paste(calendar_img, (calendar_x, 0))
-
-        two_image_height_left = 0
-        two_image_height_right = 0
-        
-        # Process and place left images
-        for i, img_path in enumerate(left_pair):
-            img = Image.open(img_path)
-            # Resize while maintaining aspect ratio
-            img_aspect = img.width / img.height
-            side_width = calendar_width
-            
-            if img.height > img.width:  # Portrait
-                # For portrait, fit by height
-                new_height = side_height
-                new_width = int(new_height * img_aspect)
-                if new_width > side_width:
-                    new_width = side_width
-                    new_height = int(new_width / img_aspect)
-            else:  # Landscape
-                # For landscape, fit by width
-                new_width = side_width
-                new_height = int(new_width / img_aspect)
-                if new_height > side_height:
-                    new_height = side_height
-                    new_width = int(new_height * img_aspect)
-            two_image_height_left = two_image_height_left + new_height
-
-        # Process and place left images
-        for i, img_path in enumerate(left_pair):
-            img = Image.open(img_path)
-            # Resize while maintaining aspect ratio
-            img_aspect = img.width / img.height
-            side_width = calendar_width
-            
-            if img.height > img.width:  # Portrait
-                # For portrait, fit by height
-                new_height = side_height
-                new_width = int(new_height * img_aspect)
-                if new_width > side_width:
-                    new_width = side_width
-                    new_height = int(new_width / img_aspect)
-            else:  # Landscape
-                # For landscape, fit by width
-                new_width = side_width
-                new_height = int(new_width / img_aspect)
-                if new_height > side_height:
-                    new_height = side_height
-                    new_width = int(new_height * img_aspect)
-            
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-
-            make_space = (calendar_height - two_image_height_left)//3
-            
-            # Calculate position (top image aligned to top, bottom image aligned to bottom)
-            x_pos = BORDER_PADDING + (side_width - new_width) // 2
-            y_pos = 0 + make_space if i == 0 else side_height - new_height - make_space  # Top for first image, bottom for second
-            
-            # Create a white background for this cell
-            cell_bg = Image.new('RGB', (side_width, side_height), '#E3EDF5')
-            # Paste the resized image onto the white background
-            cell_bg.paste(resized_img, (x_pos, y_pos))
-            # Paste the cell onto the composite
-            composite.paste(cell_bg, (0, i * side_height))
-
-        two_image_height_right = 0
-        
-        # Process and place right images
-        for i, img_path in enumerate(right_pair):
-            img = Image.open(img_path)
-            # Resize while maintaining aspect ratio
-            img_aspect = img.width / img.height
-            side_width = calendar_width
-            
-            if img.height > img.width:  # Portrait
-                # For portrait, fit by height
-                new_height = side_height
-                new_width = int(new_height * img_aspect)
-                if new_width > side_width:
-                    new_width = side_width
-                    new_height = int(new_width / img_aspect)
-            else:  # Landscape
-                # For landscape, fit by width
-                new_width = side_width
-                new_height = int(new_width / img_aspect)
-                if new_height > side_height:
-                    new_height = side_height
-                    new_width = int(new_height * img_aspect)
-            two_image_height_right = two_image_height_right + new_height
-
-        # Process and place right images
-        for i, img_path in enumerate(right_pair):
-            img = Image.open(img_path)
-            # Resize while maintaining aspect ratio
-            img_aspect = img.width / img.height
-            side_width = calendar_width
-            
-            if img.height > img.width:  # Portrait
-                # For portrait, fit by height
-                new_height = side_height
-                new_width = int(new_height * img_aspect)
-                if new_width > side_width:
-                    new_width = side_width
-                    new_height = int(new_width / img_aspect)
-            else:  # Landscape
-                # For landscape, fit by width
-                new_width = side_width
-                new_height = int(new_width / img_aspect)
-                if new_height > side_height:
-                    new_height = side_height
-                    new_width = int(new_height * img_aspect)
-            
-            resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-
-            make_space = (calendar_height - two_image_height_right)//3
-            
-            # Calculate position (top image aligned to top, bottom image aligned to bottom)
-            x_pos = (side_width - new_width) // 2 - BORDER_PADDING
-            y_pos = 0 + make_space if i == 0 else side_height - new_height - make_space  # Top for first image, bottom for second
-
-            # print(x_pos+25, y_pos)
-            
-            # Create a white background for this cell
-            cell_bg = Image.new('RGB', (side_width, side_height), '#E3EDF5')
-            # Paste the resized image onto the white background
-            cell_bg.paste(resized_img, (x_pos, y_pos))
-            # Paste the cell onto the composite
-            composite.paste(cell_bg, (calendar_width * 2, i * side_height))
-        
-        # Save the composite image
-        composite.save(os.path.join(output_dir, f'{image_count}.png'))
+        name = f'{image_count}{ext}'
+        frames[name] = frame_signature([calendar_path] + left_pair + right_pair, settings)
         image_count += 1
-        # print(two_image_height_right)
-        two_image_height_right = 0
-        two_image_height_left = 0
+        if previous.get(name) == frames[name] and os.path.exists(os.path.join(output_dir, name)):
+            continue
+        jobs.append((os.path.join(output_dir, name), left_pair, right_pair, save_params, frame_size))
+
+    # Frames left over from a longer sequence (or another format) would otherwise keep showing
+    for name in os.listdir(output_dir):
+        if name.endswith(FRAME_EXTENSIONS) and name not in frames:
+            os.remove(os.path.join(output_dir, name))
+            changed += 1
+    changed += len(jobs)
+
+    workers = max(1, min(workers, len(jobs)))
+    worker_peak = 0
+    memory_limit = cache_limit = None
+    if memory_mb and jobs:
+        workers, memory_limit, cache_limit = plan_memory(memory_mb, workers, jobs, calendar_path, frame_size)
+        print(f"Rendering with {workers} worker(s) in {memory_mb} MB")
+    if workers > 1 or memory_limit:
+        # Each worker keeps its own cell cache, so memory is bounded per process.
+        # The budget is enforced there, the display process is never capped
+        chunksize = max(1, len(jobs) // (workers * 4))
+        # Never fork the display process: it runs Tk, the preloader and the refresh
+        # threads, and a lock held by any of them would deadlock the worker
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"),
+                                 initializer=_init_worker,
+                                 initargs=(calendar_path, frame_size, memory_limit, cache_limit)) as pool:
+            if pools is not None:
+                pools.append(pool)
+            worker_peak = max(pool.map(_render_job, jobs, chunksize=chunksize), default=0)
+        if pools is not None:
+            pools.remove(pool)
+    elif jobs:
+        with Image.open(calendar_path) as calendar_img:
+            calendar_img.load()
+            calendar_img = fit_calendar(calendar_img, frame_size)
+
+        # Generate all combinations of left and right pairs
+        try:
+            for output_path, left_pair, right_pair, save_params, frame_size in jobs:
+                composite = render_frame(calendar_img, left_pair, right_pair, frame_size)
+                save_atomic(composite, output_path, **save_params)
+        finally:
+            clear_cache()
+
+    with open(index_path, 'w') as f:
+        json.dump(frames, f)
+
+    print(f"Generated {image_count-1} composite images in {output_dir} ({len(jobs)} redrawn)")
+    return changed, worker_peak
+
+# =====================================================================================
+# Column mode: render each column once and assemble frames at show time
+
+def create_columns(output_dir='downloads/extracted/columns', frame_size=None):
+    """Render left, center and right columns once instead of every LCM combination.
+
+    Returns the number of columns written, 0 when the inputs are the ones the
+    columns on disk were rendered from.
+    """
+    left_dir = 'downloads/extracted/left'
+    right_dir = 'downloads/extracted/right'
+    calendar_path = 'downloads/calendar.png'
+    home_path = 'home/home.png'
+
+    left_pairs, right_pairs = load_inputs(left_dir, right_dir, home_path)
+
+    # Any changed input redraws the columns, which are few and quick to render
+    inputs = [calendar_path, home_path] + [path for pair in left_pairs + right_pairs for path in pair]
+    signature = frame_signature(inputs, f"columns:{frame_size}")
+    index_path = os.path.join(os.path.dirname(output_dir), COLUMNS_INDEX)
+    try:
+        with open(index_path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = None
+    if previous == signature and os.path.isdir(output_dir):
+        print(f"Columns in {output_dir} are up to date")
+        return 0
+
+    # Forgotten first, half-written columns must not pass for current ones
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+
+    with Image.open(calendar_path) as calendar_img:
+        widths, calendar_height = frame_layout(calendar_img, frame_size)
+        fit_calendar(calendar_img, frame_size).save(os.path.join(output_dir, 'center.png'))
+    if frame_size is None:
+        shutil.copyfile(home_path, os.path.join(output_dir, 'home.png'))
+    else:
+        with Image.open(home_path) as home_img:
+            fit_home(home_img, frame_size).save(os.path.join(output_dir, 'home.png'))
+
+    try:
+        for side, pairs, side_width in (('left', left_pairs, widths[0]), ('right', right_pairs, widths[2])):
+            for n, pair in enumerate(pairs, start=1):
+                column = render_column(pair, side, side_width, calendar_height)
+                column.save(os.path.join(output_dir, f'{side}_{n}.png'))
+    finally:
+        clear_cache()
+
+    with open(index_path, 'w') as f:
+        json.dump(signature, f)
+    print(f"Generated {len(left_pairs)} left and {len(right_pairs)} right columns in {output_dir}")
+    return len(left_pairs) + len(right_pairs) + 2
+
+class ColumnSet:
+    """Columns written by create_columns, assembled into frames on demand.
+
+    Frame 0 is the home image, frame k > 0 shows left column (k-1) % L and
+    right column (k-1) % R, which is the same order create_composite writes.
+    """
+
+    def __init__(self, columns_dir='downloads/extracted/columns'):
+        def numbered(side):
+            names = [f for f in os.listdir(columns_dir) if f.startswith(side + '_')]
+            names.sort(key=lambda f: int(f[len(side) + 1:-4]))
+            return [Image.open(os.path.join(columns_dir, f)).convert('RGB') for f in names]
+
+        self.home = Image.open(os.path.join(columns_dir, 'home.png'))
+        self.center = Image.open(os.path.join(columns_dir, 'center.png')).convert('RGB')
+        self.left = numbered('left')
+        self.right = numbered('right')
+        self._template = None
+
+    def __len__(self):
+        return 1 + math.lcm(len(self.left), len(self.right))
+
+    def frame(self, index):
+        index %= len(self)
+        if index == 0:
+            return self.home
+        left = self.left[(index - 1) % len(self.left)]
+        right = self.right[(index - 1) % len(self.right)]
+        if self._template is None or self._template.size[0] != left.width + self.center.width + right.width:
+            # The center never changes, only the sides are pasted per frame
+            self._template = Image.new('RGB', (left.width + self.center.width + right.width, self.center.height), 'white')
+            self._template.paste(self.center, (left.width, 0))
+        composite = self._template.copy()
+        composite.paste(left, (0, 0))
+        composite.paste(right, (left.width + self.center.width, 0))
+        return composite
+
+def write_frame(columns, index, live_path):
+    """Atomically replace live_path with frame index so the viewer never sees a partial file."""
+    save_atomic(columns.frame(index), live_path)
 
-    print(f"Generated {image_count-1} composite images in {output_dir}")
+def play_columns(columns, live_path, t_slide, stop_event, start_index=0):
+    """Advance live_path to the next frame every t_slide seconds until stopped."""
+    index = start_index
+    while not stop_event.wait(float(t_slide)):
+        write_frame(columns, index, live_path)
+        index += 1
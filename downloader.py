@@ -1,61 +1,236 @@
-import json
 import os
 import glob
 import time
+import shutil
+import zipfile
 import requests
+import threading
 import subprocess
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from urllib.parse import urlsplit, urlunsplit, parse_qs, parse_qsl, urlencode, quote
+from requests.adapters import HTTPAdapter
+from watcher import DirectoryWatcher, wait_until
 
-def wait_for_downloads(download_dir, timeout=120):
+DEFAULT_BUFFER_KB = 1024
+
+# One keep-alive session shared by every HTTP download in the process
+_session = None
+
+# Held while the shared browser is driven, it cannot serve two pages at once
+browser_lock = threading.RLock()
+
+def get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+def expected_total(response, offset):
+    """Full size of the file from Content-Range or Content-Length, None if unknown."""
+    content_range = response.headers.get("Content-Range", "")
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return int(length) + (offset if response.status_code == 206 else 0)
+    return None
+
+def download_file(url, file_path, buffer_size=DEFAULT_BUFFER_KB * 1024, attempts=5, timeout=30):
+    """Stream url into file_path, resuming a .part file with HTTP Range after a dropped connection.
+
+    The file is only moved to file_path once its size matches what the server announced.
+    """
+    part_path = file_path + ".part"
+    session = get_session()
+    for attempt in range(attempts):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session.get(url, stream=True, headers=headers, timeout=timeout) as response:
+                if response.status_code == 416:
+                    # Our .part no longer matches the remote file, start over
+                    os.remove(part_path)
+                    continue
+                if response.status_code not in (200, 206):
+                    print(f"Download failed with HTTP {response.status_code}")
+                    return 0
+                if "text/html" in response.headers.get("Content-Type", "").lower():
+                    print("Download failed: Received a web page instead of a file.")
+                    return 0
+                if response.status_code == 200:
+                    # Server ignored the range request, the body is the whole file
+                    offset = 0
+                total = expected_total(response, offset)
+                mode = "ab" if response.status_code == 206 else "wb"
+                with open(part_path, mode, buffering=buffer_size) as f:
+                    for chunk in response.iter_content(chunk_size=buffer_size):
+                        if chunk:
+                            f.write(chunk)
+        except (requests.RequestException, OSError) as e:
+            print(f"Download interrupted ({e}), retrying...")
+            time.sleep(min(2 ** attempt, 30))
+            continue
+
+        size = os.path.getsize(part_path)
+        if total is not None and size != total:
+            print(f"Download incomplete ({size} of {total} bytes), resuming...")
+            continue
+        os.replace(part_path, file_path)
+        return 1
+    print("Download failed after several attempts")
+    return 0
+
+def wait_for_downloads(download_dir, watcher, existing=(), timeout=120):
+    """Wait for a new zip to land with no Chromium partial files left beside it."""
     print("Waiting for downloads to finish...")
-    end_time = time.time() + timeout
-    while time.time() < end_time:
-        if not any(glob.glob(os.path.join(download_dir, "*.crdownload"))):
-            print("Download complete!")
-            return True
-        time.sleep(1)
+
+    def finished():
+        if glob.glob(os.path.join(download_dir, "*.crdownload")):
+            return False
+        zips = glob.glob(os.path.join(download_dir, "*.zip"))
+        return any(os.path.basename(z) not in existing for z in zips)
+
+    if wait_until(finished, watcher, timeout):
+        print("Download complete!")
+        return True
     raise TimeoutError("Download did not complete within the timeout.")
 
-def download_sharepoint(sharepoint_url, download_dir):
-    chrome_options = Options()
-    chrome_options.add_experimental_option("prefs", {
-        "download.default_directory": download_dir,
-        "download.prompt_for_download": False,
-        "download.directory_upgrade": True,
-        "safebrowsing.enabled": True
-    })
-    chrome_options.add_argument("--headless=new")  # Comment out for debug
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
+def sharepoint_download_url(sharepoint_url):
+    """Turn an "Anyone with the link" file share URL into its direct download form.
 
-    driver = webdriver.Chrome(options=chrome_options)
+    With download=1 SharePoint redirects (setting a guest cookie on the way)
+    to the file itself instead of the web viewer.
+    """
+    parts = urlsplit(sharepoint_url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "download"]
+    query.append(("download", "1"))
+    return urlunsplit(parts._replace(query=urlencode(query)))
 
+def is_folder_link(sharepoint_url):
+    return "/:f:/" in urlsplit(sharepoint_url).path
+
+def sharepoint_rest(web_url, call, path):
+    # The path goes in as an alias, quotes inside it are doubled for OData
+    alias = quote("'" + path.replace("'", "''") + "'")
+    return f"{web_url}/_api/web/{call}?@p={alias}"
+
+def list_sharepoint_folder(web_url, path, timeout=30):
+    response = get_session().get(sharepoint_rest(web_url, "GetFolderByServerRelativeUrl(@p)", path)
+                                 + "&$expand=Folders,Files", headers={"Accept": "application/json;odata=nometadata"},
+                                 timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def download_sharepoint_folder(sharepoint_url, zip_file_path, buffer_size=DEFAULT_BUFFER_KB * 1024, timeout=30):
+    """Fetch a folder share over the SharePoint REST API and pack it the way the web viewer would.
+
+    Opening the share link redirects to the viewer with the folder in its id
+    parameter and sets the guest cookie, which the session sends along to
+    the REST calls. Only the files of the share and of its direct subfolders
+    are fetched, deeper ones are never ingested anyway.
+    """
+    from ingest import VALID_EXTENSIONS
+
+    session = get_session()
+    response = session.get(sharepoint_url, timeout=timeout)
+    response.raise_for_status()
+    viewer = urlsplit(response.url)
+    folder_path = parse_qs(viewer.query).get("id", [None])[0]
+    if not folder_path:
+        print("Share link did not lead to a folder")
+        return 0
+    # /personal/<user>/Documents/... or /sites/<site>/Shared Documents/..., the web is the first two segments
+    web_url = urlunsplit((viewer.scheme, viewer.netloc, "/".join(folder_path.split("/")[:3]), "", ""))
+
+    root = list_sharepoint_folder(web_url, folder_path, timeout)
+    files = [("", f) for f in root["Files"]]
+    for folder in root["Folders"]:
+        files += [(folder["Name"] + "/", f) for f in list_sharepoint_folder(web_url, folder["ServerRelativeUrl"],
+                                                                           timeout)["Files"]]
+    files = [(prefix, f) for prefix, f in files if f["Name"].lower().endswith(VALID_EXTENSIONS)]
+
+    staging = zip_file_path + ".files"
+    os.makedirs(staging, exist_ok=True)
     try:
-        print(f"Trying to download from sharepoint")
-        driver.get(sharepoint_url)
-        wait = WebDriverWait(driver, 10)
-        print("Page loading...")
+        with zipfile.ZipFile(zip_file_path + ".tmp", "w", zipfile.ZIP_STORED) as zip_ref:
+            for n, (prefix, f) in enumerate(files):
+                # Numbered, a name from the share never becomes a local path
+                path = os.path.join(staging, str(n))
+                url = sharepoint_rest(web_url, "GetFileByServerRelativeUrl(@p)/$value", f["ServerRelativeUrl"])
+                if not download_file(url, path, buffer_size, timeout=timeout):
+                    return 0
+                # Images and PDFs are compressed already, storing them is all the zip needs to do
+                zip_ref.write(path, f"{root['Name']}/{prefix}{f['Name']}")
+                os.remove(path)
+        os.replace(zip_file_path + ".tmp", zip_file_path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        if os.path.exists(zip_file_path + ".tmp"):
+            os.remove(zip_file_path + ".tmp")
+    print(f"Fetched {len(files)} files from the shared folder")
+    return 1
+
+def download_sharepoint_direct(sharepoint_url, download_dir, buffer_size=DEFAULT_BUFFER_KB * 1024):
+    print("Trying to download from sharepoint over HTTP")
+    zip_file_path = os.path.join(download_dir, "context.zip")
+    if is_folder_link(sharepoint_url):
+        # A folder is zipped by the web viewer's scripts, download=1 only returns the viewer
         try:
-            download_button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[data-id="download"]')))
+            fetched = download_sharepoint_folder(sharepoint_url, zip_file_path, buffer_size)
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f"Could not list the shared folder ({e})")
+            fetched = 0
+    else:
+        fetched = download_file(sharepoint_download_url(sharepoint_url), zip_file_path, buffer_size)
+    if not fetched:
+        return 0
+    if not zipfile.is_zipfile(zip_file_path):
+        os.remove(zip_file_path)
+        print("Direct download did not return a zip file")
+        return 0
+    print("Downloaded from sharepoint Successfully")
+    return 1
+
+def download_sharepoint(sharepoint_url, download_dir, timeout=120):
+    # Selenium is only loaded when the direct HTTP download failed
+
+    # Sources are fetched in parallel but there is only one browser
+    with browser_lock:
+        return _download_sharepoint(sharepoint_url, download_dir, timeout)
+
+def _download_sharepoint(sharepoint_url, download_dir, timeout):
+    from browser import get_driver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    # Borrowed from the shared browser, main closes it at the end of the refresh
+    driver = get_driver(download_dir)
+
+    print(f"Trying to download from sharepoint")
+    driver.get(sharepoint_url)
+    wait = WebDriverWait(driver, 10)
+    print("Page loading...")
+    try:
+        download_button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[data-id="download"]')))
+        # Watch before clicking so the zip appearing cannot be missed
+        existing = set(os.listdir(download_dir))
+        with DirectoryWatcher(download_dir) as watcher:
             print("Clicking download...")
             download_button.click()
-            time.sleep(7)
             print("Download started. Waiting for download to complete...")
-            wait_for_downloads(download_dir)
-            print("Download should be complete.")
-            return 1
-        except Exception as e:
-            print("Could not find the download button. You might not have access.")
-            print(f"Details: {e}")
-            return 0
-    finally:
-        driver.quit()
+            wait_for_downloads(download_dir, watcher, existing, timeout)
+        print("Download should be complete.")
+        return 1
+    except Exception as e:
+        print("Could not find the download button. You might not have access.")
+        print(f"Details: {e}")
+        return 0
 
-def download_dropbox(dropbox_url, download_dir):
+def download_dropbox(dropbox_url, download_dir, buffer_size=DEFAULT_BUFFER_KB * 1024):
     try:
         print(f"Downloading folder from Dropbox URL")
         if "dl=0" in dropbox_url:
@@ -64,13 +239,7 @@ def download_dropbox(dropbox_url, download_dir):
             dropbox_url += "&dl=1"
         zip_file_path = os.path.join(download_dir, "context.zip")
 
-        response = requests.get(dropbox_url, stream=True)
-        content_type = response.headers.get("Content-Type", "")
-        if response.status_code == 200 and "text/html" not in content_type.lower():
-            with open(zip_file_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+        if download_file(dropbox_url, zip_file_path, buffer_size):
             # Validate file size
             if os.path.getsize(zip_file_path) < 1024:  # Veryyyy small
                 os.remove(zip_file_path)
@@ -86,27 +255,17 @@ def download_dropbox(dropbox_url, download_dir):
         return 0
 
 
-def download_folder(config_key="home-url", json_file="config.json", destination="downloads"):
-    try:
-        with open(json_file) as f:
-            config = json.load(f)
-            sharepoint_url = config.get(config_key, "")
-            if not sharepoint_url:
-                print(f"Error: {config_key} not found in config.json")
-                return 0
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        return 0
-
-    download_dir = os.path.join(os.getcwd(), destination)
-    os.makedirs(download_dir, exist_ok=True)
-
+def download_url(sharepoint_url, download_dir, buffer_size=DEFAULT_BUFFER_KB * 1024, timeout=120):
+    """Download a shared SharePoint or Dropbox folder as a zip into download_dir."""
     if "sharepoint" in sharepoint_url.lower():
-        return download_sharepoint(sharepoint_url, download_dir)
+        if download_sharepoint_direct(sharepoint_url, download_dir, buffer_size):
+            return 1
+        # Only pay for a browser when the share could not be fetched directly
+        print("Direct download failed, falling back to the browser")
+        return download_sharepoint(sharepoint_url, download_dir, timeout)
     elif "dropbox" in sharepoint_url.lower():
-        return download_dropbox(sharepoint_url, download_dir)
+        return download_dropbox(sharepoint_url, download_dir, buffer_size)
     else:
         print(f"URL not supported: {sharepoint_url}")
         return 0
 
-# download_folder("home-url", "config.json", "downloads")
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import shutil
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from sync import file_hash, link_or_copy
+from bundle import BUNDLE_ROOT, FRAME_EXTENSIONS, read_bundle, current_bundle, publish_bundle
+
+# Served by the render node: manifest.json plus objects/<sha256><ext>
+STORE_DIR = os.path.join(BUNDLE_ROOT, "store")
+# Kept by a display client, frames it already has are never fetched again
+OBJECTS_CACHE = os.path.join("cache", "objects")
+MANIFEST_FILE = "manifest.json"
+OBJECTS_DIR = "objects"
+DEFAULT_PORT = 8700
+# What object_name() produces, anything else in a manifest is refused
+OBJECT_PATTERN = re.compile(r"^[0-9a-f]{64}\.[a-z]+$")
+
+def object_name(digest, name):
+    # The extension stays, the player and PIL choose the decoder from it
+    return digest + os.path.splitext(name)[1].lower()
+
+def write_json_atomic(data, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+# =====================================================================================
+# Render node
+
+def export_bundle(bundle_path, store=STORE_DIR):
+    """Add the frames of a published bundle to the store and point manifest.json at them.
+
+    Objects are named by their SHA-256, so a frame that did not change between
+    refreshes keeps its name and clients skip it. Objects of the previous
+    manifest are kept for a client that is still halfway through fetching it.
+    """
+    objects_dir = os.path.join(store, OBJECTS_DIR)
+    os.makedirs(objects_dir, exist_ok=True)
+    info = read_bundle(bundle_path)
+    frames_dir = os.path.join(bundle_path, "frames")
+
+    frames = []
+    for name in sorted(os.listdir(frames_dir)):
+        path = os.path.join(frames_dir, name)
+        if not os.path.isfile(path):
+            continue
+        digest = file_hash(path)
+        obj = object_name(digest, name)
+        if not os.path.exists(os.path.join(objects_dir, obj)):
+            link_or_copy(path, os.path.join(objects_dir, obj))
+        frames.append({"name": name, "object": obj, "size": os.path.getsize(path)})
+
+    manifest_path = os.path.join(store, MANIFEST_FILE)
+    keep = {frame["object"] for frame in frames}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            keep.update(frame["object"] for frame in json.load(f)["frames"])
+    manifest = {"version": info["version"], "mode": info.get("mode", "frames"),
+                "created": info.get("created"), "frames": frames}
+    # Objects first, then the manifest, a client never sees a name it cannot fetch
+    write_json_atomic(manifest, manifest_path)
+
+    for name in os.listdir(objects_dir):
+        if name not in keep:
+            os.remove(os.path.join(objects_dir, name))
+    print(f"Serving slide bundle {info['version']} ({len(frames)} frames)")
+    return manifest
+
+class StoreHandler(SimpleHTTPRequestHandler):
+    """Serves the store, objects never change so clients and proxies may keep them forever."""
+
+    def end_headers(self):
+        if self.path.startswith(f"/{OBJECTS_DIR}/"):
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        else:
+            self.send_header("Cache-Control", "no-cache")
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass  # One line per frame and client is too much for the Pi's log
+
+def serve_store(store=STORE_DIR, host="", port=DEFAULT_PORT):
+    """Serve the store over HTTP from a daemon thread. Returns the server, shutdown() stops it."""
+    os.makedirs(store, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), partial(StoreHandler, directory=os.path.abspath(store)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving slide bundles on port {server.server_address[1]}")
+    return server
+
+# =====================================================================================
+# Display client
+
+def fetch_manifest(server_url, timeout=30):
+    from downloader import get_session
+    response = get_session().get(f"{server_url.rstrip('/')}/{MANIFEST_FILE}", timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def check_frame(frame):
+    """Refuse a manifest entry that would write outside the cache or the bundle.
+
+    The manifest is not authenticated, so its names are only used when they
+    are plain frame file names and content-hash object names.
+    """
+    if not isinstance(frame, dict):
+        raise ValueError(f"refusing frame {frame!r}")
+    name, obj = frame.get("name"), frame.get("object")
+    if not isinstance(name, str) or os.path.basename(name) != name or name in ("", ".", "..") \
+            or not name.lower().endswith(FRAME_EXTENSIONS):
+        raise ValueError(f"refusing frame name {name!r}")
+    if not isinstance(obj, str) or not OBJECT_PATTERN.match(obj):
+        raise ValueError(f"refusing object name {obj!r}")
+
+def fetch_object(server_url, obj, cache=OBJECTS_CACHE, timeout=30):
+    """Download one object into the cache unless it is there already. Returns the bytes fetched."""
+    from downloader import download_file
+
+    if not OBJECT_PATTERN.match(obj):
+        raise ValueError(f"refusing object name {obj!r}")
+    path = os.path.join(cache, obj)
+    if os.path.exists(path):
+        return 0
+    tmp_path = path + ".tmp"
+    if not download_file(f"{server_url.rstrip('/')}/{OBJECTS_DIR}/{obj}", tmp_path, timeout=timeout):
+        raise OSError(f"could not download {obj}")
+    # The name is the content hash, which also catches a damaged transfer
+    if file_hash(tmp_path) != os.path.splitext(obj)[0]:
+        os.remove(tmp_path)
+        raise OSError(f"{obj} does not match its hash")
+    size = os.path.getsize(tmp_path)
+    os.replace(tmp_path, path)
+    return size
+
+def pull_bundle(server_url, timeout=30, cache=OBJECTS_CACHE, staging=os.path.join("downloads", "pulled")):
+    """Bring the current bundle of a render node here and publish it.
+
+    Only objects missing from the cache are downloaded. Returns the bytes
+    fetched and the frames in the bundle, or None when the local bundle is
+    already up to date.
+    """
+    manifest = fetch_manifest(server_url, timeout)
+    bundle = current_bundle()
+    if bundle and read_bundle(bundle).get("source") == manifest["version"]:
+        print(f"Slide bundle {manifest['version']} is up to date")
+        return None
+
+    for frame in manifest["frames"]:
+        check_frame(frame)
+
+    os.makedirs(cache, exist_ok=True)
+    downloaded = fetched = 0
+    for frame in manifest["frames"]:
+        size = fetch_object(server_url, frame["object"], cache, timeout)
+        downloaded += size
+        fetched += bool(size)
+    print(f"Fetched {fetched} of {len(manifest['frames'])} frames ({downloaded / 2**20:.1f} MB)")
+
+    # Hard links, the bundle costs no extra space next to the cache
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for frame in manifest["frames"]:
+        link_or_copy(os.path.join(cache, frame["object"]), os.path.join(staging, frame["name"]))
+    publish_bundle(staging, manifest["mode"], source=manifest["version"])
+    shutil.rmtree(staging, ignore_errors=True)
+
+    keep = {frame["object"] for frame in manifest["frames"]}
+    for name in os.listdir(cache):
+        if name not in keep:
+            os.remove(os.path.join(cache, name))
+    return downloaded, len(manifest["frames"])
@@ -1,39 +1,75 @@
 import os
-import time
 import json
+import hashlib
 import textwrap
 import subprocess
 from datetime import datetime
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
+import requests
+from bs4 import BeautifulSoup, SoupStrainer
+from downloader import get_session, browser_lock
 from PIL import Image, ImageDraw, ImageFont
+from PIL.PngImagePlugin import PngInfo
 
-def get_calendar(calendar_url, destination):
-    # Configuration
-    ASPECT_RATIO = (4, 6)  # Width:Height ratio of 4:6
-    IMAGE_WIDTH = 800  # Base width in pixels
-    IMAGE_HEIGHT = int(IMAGE_WIDTH * ASPECT_RATIO[1] / ASPECT_RATIO[0])  # Height calculated from aspect ratio
+MAX_EVENTS = 8
+EVENT_SELECTOR = ".hh-calendar-content"
+CALENDAR_CACHE_DIR = os.path.join("cache", "calendar")
 
-    # Selenium setup to scrape events
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")  # Comment out for debug
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
+# lxml builds the tree several times faster than the pure Python parser
+try:
+    import lxml
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
-    driver = webdriver.Chrome(options=chrome_options)
-    driver.get(calendar_url)
+# Resolved font path and loaded fonts, reused across refreshes
+_font_path = None
+_font_cache = {}
 
-    # Wait for events to load
-    time.sleep(3)
+def find_font():
+    """Locate Arial Bold once per process instead of running fc-list on every render."""
+    global _font_path
+    if _font_path is None:
+        try:
+            res=subprocess.check_output("fc-list | grep -i 'ARIALBD.TTF' | head -n 1 | cut -d: -f1", shell=True, text=True)
+            _font_path=res.strip()
+        except:
+            _font_path="Arial Bold"
+    return _font_path
+
+def load_font(name, size):
+    key = (name, size)
+    if key not in _font_cache:
+        _font_cache[key] = ImageFont.truetype(name, size)
+    return _font_cache[key]
+
+def normalize_events(events):
+    """Collapse whitespace and keep only the events that get drawn."""
+    return [{key: " ".join(str(value).split()) for key, value in event.items()}
+            for event in events[:MAX_EVENTS]]
+
+def events_hash(events, size):
+    payload = json.dumps({"events": events, "size": list(size)}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def rendered_hash(image_path):
+    """Hash stored in an existing calendar.png, None if there is none."""
+    try:
+        with Image.open(image_path) as img:
+            return img.text.get("events-hash")
+    except (OSError, AttributeError):
+        return None
 
-    html = driver.page_source
-    soup = BeautifulSoup(html, 'html.parser')
+def parse_events(html):
+    """Read events out of the calendar page, only building the event blocks."""
+    # Match on the split class list, a plain class_ string misses blocks with extra classes
+    event_class = EVENT_SELECTOR[1:]
+    strainer = SoupStrainer(class_=lambda value: value is not None and event_class in value.split())
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=strainer)
 
     events = []
 
     # Collect event data
-    for item in soup.select(".hh-calendar-content"):
+    for item in soup.select(EVENT_SELECTOR):
         date_day = item.select_one(".hh-calendar-date-day").text.strip()
         date_month = item.select_one(".hh-calendar-date-month").text.strip()
         title = item.select_one(".hh-calendar-heading").text.strip()
@@ -48,173 +84,270 @@ def get_calendar(calendar_url, destination):
             "date": event_date,
             "description": desc
         })
+    return events
 
-    driver.quit()
+def fetch_calendar_html(calendar_url, timeout=10, cache_dir=CALENDAR_CACHE_DIR):
+    """GET the calendar page, answering a 304 from the copy saved last time."""
+    meta_path = os.path.join(cache_dir, "page.json")
+    body_path = os.path.join(cache_dir, "page.html")
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
 
-    def create_calendar_image(events, output_path="downloads/calendar.png"):
-        """Create a calendar image with event listings in portrait orientation with 4:6 aspect ratio"""
-        
-        # Create base image with light blue background (matching the image)
-        img = Image.new('RGB', (IMAGE_WIDTH, IMAGE_HEIGHT), color='#E3EDF5')
-        draw = ImageDraw.Draw(img)
-        fname = ""
-        try:
-            res=subprocess.check_output("fc-list | grep -i 'ARIALBD.TTF' | head -n 1 | cut -d: -f1", shell=True, text=True)
-            fname=res.strip()
-        except:
-            fname="Arial Bold"
+    headers = {}
+    if meta.get("url") == calendar_url and os.path.exists(body_path):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last-modified"):
+            headers["If-Modified-Since"] = meta["last-modified"]
+
+    try:
+        response = get_session().get(calendar_url, headers=headers, timeout=timeout)
+    except requests.RequestException as e:
+        print(f"Could not fetch the calendar page: {e}")
+        return None
+
+    if response.status_code == 304:
+        print("Calendar page not modified")
+        with open(body_path, encoding="utf-8") as f:
+            return f.read()
+    if response.status_code != 200:
+        print(f"Calendar page returned HTTP {response.status_code}")
+        return None
 
-        # Try to load fonts - use default if specific fonts not available
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(body_path, "w", encoding="utf-8") as f:
+        f.write(response.text)
+    with open(meta_path, "w") as f:
+        json.dump({
+            "url": calendar_url,
+            "etag": response.headers.get("ETag"),
+            "last-modified": response.headers.get("Last-Modified"),
+        }, f)
+    return response.text
+
+def scrape_with_browser(calendar_url, timeout=10):
+    # Selenium is only loaded when the plain HTTP path was not enough
+    from browser import get_driver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+
+    # Scrape events with the shared browser
+    with browser_lock:
+        driver = get_driver()
+        driver.get(calendar_url)
+
+        # Wait for events to load, timeout is only an upper bound
         try:
-            title_font = ImageFont.truetype(fname, 30)
-            event_title_font = ImageFont.truetype(fname, 20)
-            date_font = ImageFont.truetype(fname, 22)
-            desc_font = ImageFont.truetype(fname.replace(" Bold", ""), 14)
-        except IOError:
-            # Fallback to default font
-            title_font = ImageFont.load_default()
-            event_title_font = ImageFont.load_default()
-            date_font = ImageFont.load_default()
-            time_font = ImageFont.load_default()
-            desc_font = ImageFont.load_default()
-            fname = ImageFont.load_default()
-        
-        # Draw title with proper positioning
-        print(fname)
-        calendar_w = draw.textlength("CALENDAR", font=title_font)
-        draw.text(((IMAGE_WIDTH - calendar_w) // 2, 30), "CALENDAR", fill="#000814", font=title_font)
-        
-        # Calculate spacing for events - adjust based on number of events
-        start_y = 80
-        event_height = 140  # Base height for each event
-        event_spacing = 20  # Space between events
-        
-        # Draw each event (maximum 8)
-        for i, event in enumerate(events[:8]):
-            y_pos = start_y + i * (event_height + event_spacing)
-            
-            # Create a rounded rectangle for the entire event card
-            card_width = IMAGE_WIDTH - 80  # 40px margin on each side
-            card_height = event_height
-            card_radius = 20  # Rounded corner radius
-            
-            # Draw white rounded rectangle for the card
-            draw_rounded_rectangle(draw, (40, y_pos, 40 + card_width, y_pos + card_height), 
-                                  radius=card_radius, fill='#FFFFFF')
-            
-            date_text = event['date']
-            
-            # Create colored date/time box on the left
-            box_width = 150
-            box_height = card_height
-            box_colors = ['#A8D0E6', '#D8B7DD']
-            box_color = box_colors[i % len(box_colors)]
-            
-            # Draw rounded rectangle for date box (only rounded on left side)
-            draw_rounded_rectangle(draw, 
-                                  (40, y_pos, 40 + box_width, y_pos + box_height),
-                                  radius=card_radius, fill=box_color, 
-                                  corners=(True, False, True, False))  # Only round left corners
-            
-            # Draw date text centered in the box
-            # date_w = draw.textlength(date_text, font=date_font)
-            # date_h = draw.textheight(date_text, font=date_font)
-            text_bbox = draw.textbbox((0, 0), date_text, font=date_font)
-            date_w = text_bbox[2] - text_bbox[0]  # Width of the text
-            date_h = text_bbox[3] - text_bbox[1]  # Height of the text
-            date_x = 40 + (box_width - date_w) // 2
-            draw.text((date_x, y_pos - 3 + (box_height-date_h)//2), date_text, fill="#2D3748", font=date_font)
-            
-            # Event details section - to the right of the date/time box
-            details_x = 40 + box_width + 20  # Start of event details
-            details_width = card_width - box_width - 40  # Width available for details
-            
-            # Draw event title
-            if 'title' in event and event['title']:
-                title_y = y_pos + 20
-                max_width = details_width
-                wrapped_text = textwrap.fill(event['title'], width=max_width // 10)  # Approximate width
-                lines = wrapped_text.split('\n')[:2]
-                wrapped_text = '\n'.join(lines)
-                draw.text((details_x, title_y), wrapped_text, fill="#1A202C", font=event_title_font)
-            
-            # Draw event description with text wrapping
-            if 'description' in event and event['description']:
-                desc_y = y_pos + 55 + (wrapped_text.count("\n")*25)
-                
-                # Wrap text to fit in the available space
-                max_width = details_width
-                wrapped_text = textwrap.fill(event['description'], width=max_width // 7)  # Approximate width
-                
-                # Limit to just 2 lines to save space
-                lines = wrapped_text.split('\n')[:2]
-                wrapped_text = '\n'.join(lines)
-                
-                draw.text((details_x, desc_y), wrapped_text, fill="#4A5568", font=desc_font)
-
-            # if 'location' in event and event['location'] and event['location'] != "None":
-            #     loc_y = y_pos + 85
-            #     draw.text((details_x, loc_y), event['location'], fill="#718096", font=desc_font)
-        
-        # Save the image
-        img.save(output_path)
-        print(f"Calendar image saved as {output_path} ({IMAGE_WIDTH}x{IMAGE_HEIGHT} pixels)")
-        return img
-
-    def draw_rounded_rectangle(draw, xy, radius=10, fill=None, outline=None, width=1, corners=(True, True, True, True)):
-        x1, y1, x2, y2 = xy
-        width = max(width, 1)  # Make sure width is at least 1
-        
-        # If the radius is too large, adjust it
-        radius = min(radius, (x2 - x1) // 2, (y2 - y1) // 2)
-        
-        # Draw four corners
-        if corners[0]:  # top-left
-            draw.pieslice([x1, y1, x1 + radius * 2, y1 + radius * 2], 180, 270, fill=fill, outline=outline, width=width)
-        else:
-            draw.rectangle([x1, y1, x1 + radius, y1 + radius], fill=fill, outline=outline, width=width)
-            
-        if corners[1]:  # top-right
-            draw.pieslice([x2 - radius * 2, y1, x2, y1 + radius * 2], 270, 0, fill=fill, outline=outline, width=width)
-        else:
-            draw.rectangle([x2 - radius, y1, x2, y1 + radius], fill=fill, outline=outline, width=width)
-            
-        if corners[2]:  # bottom-right
-            draw.pieslice([x2 - radius * 2, y2 - radius * 2, x2, y2], 0, 90, fill=fill, outline=outline, width=width)
-        else:
-            draw.rectangle([x2 - radius, y2 - radius, x2, y2], fill=fill, outline=outline, width=width)
-            
-        if corners[3]:  # bottom-left
-            draw.pieslice([x1, y2 - radius * 2, x1 + radius * 2, y2], 90, 180, fill=fill, outline=outline, width=width)
-        else:
-            draw.rectangle([x1, y2 - radius, x1 + radius, y2], fill=fill, outline=outline, width=width)
-        
-        # Draw connecting rectangles
-        draw.rectangle([x1 + radius, y1, x2 - radius, y1 + radius], fill=fill, outline=fill)  # top
-        draw.rectangle([x1, y1 + radius, x1 + radius, y2 - radius], fill=fill, outline=fill)  # left
-        draw.rectangle([x2 - radius, y1 + radius, x2, y2 - radius], fill=fill, outline=fill)  # right
-        draw.rectangle([x1 + radius, y2 - radius, x2 - radius, y2], fill=fill, outline=fill)  # bottom
-        
-        # Fill in the center
-        draw.rectangle([x1 + radius, y1 + radius, x2 - radius, y2 - radius], fill=fill, outline=fill)
+            WebDriverWait(driver, timeout).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, EVENT_SELECTOR)))
+        except TimeoutException:
+            print("Calendar events did not appear in time")
+
+        return parse_events(driver.page_source)
+
+# Calendar layout, drawn for BASE_WIDTH and scaled to the requested size
+ASPECT_RATIO = (4, 6)  # Width:Height ratio of 4:6
+BASE_WIDTH = 800  # Base width in pixels
+BASE_HEIGHT = int(BASE_WIDTH * ASPECT_RATIO[1] / ASPECT_RATIO[0])  # Height calculated from aspect ratio
+
+def draw_rounded_rectangle(draw, xy, radius=10, fill=None, outline=None, width=1, corners=(True, True, True, True)):
+    x1, y1, x2, y2 = xy
+    width = max(width, 1)  # Make sure width is at least 1
+
+    # If the radius is too large, adjust it
+    radius = min(radius, (x2 - x1) // 2, (y2 - y1) // 2)
+
+    # Draw four corners
+    if corners[0]:  # top-left
+        draw.pieslice([x1, y1, x1 + radius * 2, y1 + radius * 2], 180, 270, fill=fill, outline=outline, width=width)
+    else:
+        draw.rectangle([x1, y1, x1 + radius, y1 + radius], fill=fill, outline=outline, width=width)
+
+    if corners[1]:  # top-right
+        draw.pieslice([x2 - radius * 2, y1, x2, y1 + radius * 2], 270, 0, fill=fill, outline=outline, width=width)
+    else:
+        draw.rectangle([x2 - radius, y1, x2, y1 + radius], fill=fill, outline=outline, width=width)
+
+    if corners[2]:  # bottom-right
+        draw.pieslice([x2 - radius * 2, y2 - radius * 2, x2, y2], 0, 90, fill=fill, outline=outline, width=width)
+    else:
+        draw.rectangle([x2 - radius, y2 - radius, x2, y2], fill=fill, outline=outline, width=width)
+
+    if corners[3]:  # bottom-left
+        draw.pieslice([x1, y2 - radius * 2, x1 + radius * 2, y2], 90, 180, fill=fill, outline=outline, width=width)
+    else:
+        draw.rectangle([x1, y2 - radius, x1 + radius, y2], fill=fill, outline=outline, width=width)
+
+    # Draw connecting rectangles
+    draw.rectangle([x1 + radius, y1, x2 - radius, y1 + radius], fill=fill, outline=fill)  # top
+    draw.rectangle([x1, y1 + radius, x1 + radius, y2 - radius], fill=fill, outline=fill)  # left
+    draw.rectangle([x2 - radius, y1 + radius, x2, y2 - radius], fill=fill, outline=fill)  # right
+    draw.rectangle([x1 + radius, y2 - radius, x2 - radius, y2], fill=fill, outline=fill)  # bottom
+
+    # Fill in the center
+    draw.rectangle([x1 + radius, y1 + radius, x2 - radius, y2 - radius], fill=fill, outline=fill)
+
+def create_calendar_image(events, output_path="downloads/calendar.png", digest=None, size=None):
+    """Create a calendar image with event listings in portrait orientation with 4:6 aspect ratio"""
+    # Draw straight at the size of the center column of the frame when it is known
+    IMAGE_WIDTH, IMAGE_HEIGHT = size or (BASE_WIDTH, BASE_HEIGHT)
+    SCALE = min(IMAGE_WIDTH / BASE_WIDTH, IMAGE_HEIGHT / BASE_HEIGHT)
+
+    def px(value):
+        """Layout value in pixels at the output size."""
+        return max(1, round(value * SCALE))
+
+    # Create base image with light blue background (matching the image)
+    img = Image.new('RGB', (IMAGE_WIDTH, IMAGE_HEIGHT), color='#E3EDF5')
+    draw = ImageDraw.Draw(img)
+    fname = find_font()
+
+    # Try to load fonts - use default if specific fonts not available
+    try:
+        title_font = load_font(fname, px(30))
+        event_title_font = load_font(fname, px(20))
+        date_font = load_font(fname, px(22))
+        desc_font = load_font(fname.replace(" Bold", ""), px(14))
+    except IOError:
+        # Fallback to default font
+        title_font = ImageFont.load_default()
+        event_title_font = ImageFont.load_default()
+        date_font = ImageFont.load_default()
+        time_font = ImageFont.load_default()
+        desc_font = ImageFont.load_default()
+        fname = ImageFont.load_default()
+
+    # Draw title with proper positioning
+    print(fname)
+    calendar_w = draw.textlength("CALENDAR", font=title_font)
+    draw.text(((IMAGE_WIDTH - calendar_w) // 2, px(30)), "CALENDAR", fill="#000814", font=title_font)
+
+    # Calculate spacing for events - adjust based on number of events
+    start_y = px(80)
+    event_height = px(140)  # Base height for each event
+    event_spacing = px(20)  # Space between events
+    margin = px(40)
+
+    # Draw each event (maximum 8)
+    for i, event in enumerate(events[:MAX_EVENTS]):
+        y_pos = start_y + i * (event_height + event_spacing)
+
+        # Create a rounded rectangle for the entire event card
+        card_width = IMAGE_WIDTH - 2 * margin  # 40px margin on each side
+        card_height = event_height
+        card_radius = px(20)  # Rounded corner radius
+
+        # Draw white rounded rectangle for the card
+        draw_rounded_rectangle(draw, (margin, y_pos, margin + card_width, y_pos + card_height), 
+                              radius=card_radius, fill='#FFFFFF')
+
+        date_text = event['date']
+
+        # Create colored date/time box on the left
+        box_width = px(150)
+        box_height = card_height
+        box_colors = ['#A8D0E6', '#D8B7DD']
+        box_color = box_colors[i % len(box_colors)]
+
+        # Draw rounded rectangle for date box (only rounded on left side)
+        draw_rounded_rectangle(draw, 
+                              (margin, y_pos, margin + box_width, y_pos + box_height),
+                              radius=card_radius, fill=box_color, 
+                              corners=(True, False, True, False))  # Only round left corners
+
+        # Draw date text centered in the box
+        # date_w = draw.textlength(date_text, font=date_font)
+        # date_h = draw.textheight(date_text, font=date_font)
+        text_bbox = draw.textbbox((0, 0), date_text, font=date_font)
+        date_w = text_bbox[2] - text_bbox[0]  # Width of the text
+        date_h = text_bbox[3] - text_bbox[1]  # Height of the text
+        date_x = margin + (box_width - date_w) // 2
+        draw.text((date_x, y_pos - px(3) + (box_height-date_h)//2), date_text, fill="#2D3748", font=date_font)
+
+        # Event details section - to the right of the date/time box
+        details_x = margin + box_width + px(20)  # Start of event details
+        details_width = card_width - box_width - px(40)  # Width available for details
+
+        # Draw event title
+        if 'title' in event and event['title']:
+            title_y = y_pos + px(20)
+            max_width = details_width
+            wrapped_text = textwrap.fill(event['title'], width=max_width // px(10))  # Approximate width
+            lines = wrapped_text.split('\n')[:2]
+            wrapped_text = '\n'.join(lines)
+            draw.text((details_x, title_y), wrapped_text, fill="#1A202C", font=event_title_font)
+
+        # Draw event description with text wrapping
+        if 'description' in event and event['description']:
+            desc_y = y_pos + px(55) + (wrapped_text.count("\n")*px(25))
+
+            # Wrap text to fit in the available space
+            max_width = details_width
+            wrapped_text = textwrap.fill(event['description'], width=max_width // px(7))  # Approximate width
+
+            # Limit to just 2 lines to save space
+            lines = wrapped_text.split('\n')[:2]
+            wrapped_text = '\n'.join(lines)
+
+            draw.text((details_x, desc_y), wrapped_text, fill="#4A5568", font=desc_font)
+
+        # if 'location' in event and event['location'] and event['location'] != "None":
+        #     loc_y = y_pos + 85
+        #     draw.text((details_x, loc_y), event['location'], fill="#718096", font=desc_font)
+
+    # Save the image, tagged with the events it was drawn from
+    pnginfo = PngInfo()
+    if digest:
+        pnginfo.add_text("events-hash", digest)
+    tmp_path = output_path + ".tmp"
+    img.save(tmp_path, format="PNG", pnginfo=pnginfo)
+    os.replace(tmp_path, output_path)
+    print(f"Calendar image saved as {output_path} ({IMAGE_WIDTH}x{IMAGE_HEIGHT} pixels)")
+    return img
+
+def get_calendar(calendar_url, destination, timeout=10, mode="http", size=None):
+    """Draw the calendar into destination. Returns True when it was redrawn, None when unchanged."""
+    events = []
+    if mode != "browser":
+        html = fetch_calendar_html(calendar_url, timeout)
+        if html:
+            events = parse_events(html)
+    if not events:
+        # Events are missing from the plain page, let a real browser render it
+        print("Falling back to the browser for the calendar")
+        events = scrape_with_browser(calendar_url, timeout)
+
+    # Skip drawing when the events are the same as in the current image, the
+    # untouched file also lets create_composite keep its frames
+    events = normalize_events(events)
+    digest = events_hash(events, size or (BASE_WIDTH, BASE_HEIGHT))
+    output_path = destination+"/calendar.png"
+    if rendered_hash(output_path) == digest:
+        print("Calendar unchanged, keeping the existing image")
+        return None
 
     # Pass the events to the calendar image function
-    create_calendar_image(events, destination+"/calendar.png")
+    create_calendar_image(events, output_path, digest, size)
+    return True
 
-def download_calendar(key="calendar-url", json_file="config.json", destination="downloads"):
+def download_calendar(key="calendar-url", json_file="config.json", destination="downloads", size=None):
+    """Returns True when the calendar was redrawn, None when it is unchanged and False on failure."""
     download_dir = os.path.join(os.getcwd(), destination)
     os.makedirs(download_dir, exist_ok=True)
     try:
         with open(json_file) as f:
             config = json.load(f)
-            calendar_url = config.get(key, "")
-            get_calendar(calendar_url, destination)
-            return 1
-            if not calendar_url:
-                print(f"Error: calendar-url not found in config.json")
-                return 0
+        calendar_url = config.get(key, "")
+        if not calendar_url:
+            print(f"Error: calendar-url not found in config.json")
+            return False
+        return get_calendar(calendar_url, destination, int(config.get("calendar-timeout", 10)),
+                            config.get("calendar-mode", "http"), size)
     except Exception as e:
         print(f"Error loading config: {e}")
-        return 0
-
-download_calendar("calendar-url", "config.json", "downloads")
\ No newline at end of file
+        return False
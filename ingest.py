@@ -0,0 +1,98 @@
+import os
+import shutil
+import zipfile
+
+VALID_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf')
+DEFAULT_MAX_FILE_MB = 200
+DEFAULT_MAX_TOTAL_MB = 2000
+
+class MemberTooLarge(Exception):
+    pass
+
+def top_level_prefix(infos):
+    """Return "folder/" when every member sits under one top-level folder, else ""."""
+    tops = {info.filename.split('/', 1)[0] for info in infos}
+    if len(tops) != 1:
+        return ""
+    top = tops.pop()
+    if any(info.filename == top for info in infos):
+        # A single top-level file, nothing to flatten
+        return ""
+    return top + '/'
+
+def copy_limited(src, dst, limit, buffer_size):
+    # The size in the zip header can lie, so count what is actually inflated
+    copied = 0
+    while True:
+        chunk = src.read(buffer_size)
+        if not chunk:
+            return copied
+        copied += len(chunk)
+        if copied > limit:
+            raise MemberTooLarge()
+        dst.write(chunk)
+
+def ingest_zip(zip_path, extract_path, sides=("left", "right"), max_file_mb=DEFAULT_MAX_FILE_MB,
+               max_total_mb=DEFAULT_MAX_TOTAL_MB, buffer_size=1024 * 1024, folders=None):
+    """Write only the displayable files of left/ and right/ from the zip into extract_path.
+
+    The common top-level folder is stripped on the fly, other members are never
+    written. folders maps folders of the zip to the side they feed, "" meaning
+    files at the root, by default every side reads its own folder. Returns the
+    set of top-level folder names found (lowercased).
+    """
+    if folders is None:
+        folders = {side: side for side in sides}
+    max_file = max_file_mb * 1024 * 1024
+    max_total = max_total_mb * 1024 * 1024
+    if os.path.exists(extract_path):
+        shutil.rmtree(extract_path)
+    os.makedirs(extract_path)
+
+    found_folders = set()
+    written = skipped = total = 0
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        infos = zip_ref.infolist()
+        prefix = top_level_prefix(infos)
+        if prefix:
+            print("Flattened zip structure to remove top-level folder.")
+
+        for info in infos:
+            if not info.filename.startswith(prefix):
+                continue
+            parts = info.filename[len(prefix):].rstrip('/').split('/')
+            if parts[0] and (info.is_dir() or len(parts) > 1):
+                found_folders.add(parts[0].lower())
+                # Only folders present in the zip exist afterwards, so a missing
+                # side is told apart from an empty one
+                if parts[0] in folders:
+                    os.makedirs(os.path.join(extract_path, folders[parts[0]]), exist_ok=True)
+            if info.is_dir() or len(parts) > 2:
+                continue
+            folder, filename = parts if len(parts) == 2 else ("", parts[0])
+            side = folders.get(folder)
+            if side is None or not filename.lower().endswith(VALID_EXTENSIONS):
+                skipped += 1
+                continue
+            os.makedirs(os.path.join(extract_path, side), exist_ok=True)
+            if info.file_size > max_file:
+                print(f"Skipping {info.filename}: larger than {max_file_mb} MB")
+                skipped += 1
+                continue
+            if total + info.file_size > max_total:
+                print(f"Zip content exceeds {max_total_mb} MB, ignoring the remaining files")
+                break
+
+            target = os.path.join(extract_path, side, filename)
+            try:
+                with zip_ref.open(info) as src, open(target, 'wb') as dst:
+                    total += copy_limited(src, dst, max_file, buffer_size)
+            except MemberTooLarge:
+                os.remove(target)
+                print(f"Skipping {info.filename}: larger than {max_file_mb} MB")
+                skipped += 1
+                continue
+            written += 1
+
+    print(f"Extracted {written} file(s), skipped {skipped}")
+    return found_folders
@@ -1,23 +1,28 @@
 import os
 import json
-import time
 import shutil
-import zipfile
-import requests
 import argparse
+import threading
 import subprocess
-from pynput import keyboard
-from downloader import download_folder
-from hhcalendar import download_calendar
-from composite import create_composite
+from sync import sync_folders, stop_rasterizing, pdf_scale, MANIFEST_FILE
+from bundle import current_bundle, read_bundle, publish_bundle, FRAME_EXTENSIONS
+from metrics import RefreshMetrics, DEFAULT_LOG
+from sources import SOURCES_DIR, load_sources, fetch_sources, ingest_sources
+
+# selenium, bs4, PIL, requests and pynput are imported inside the stages that
+# use them, so "-skip" reaches the slideshow without loading any of them
 
 import sys
 import glob
 import signal
+import asyncio
+import urllib.parse
 
-exit_flag = False
-restart_flag = False
 keyboard_listener = None
+display_engine = None
+# Event queue of the running supervisor and its loop, see post_event
+events = None
+event_loop = None
 
 # =====================================================================================
 
@@ -26,17 +31,18 @@ config_file = "config.json"
 destination_folder = "downloads"
 # Download Path
 download_dir = os.path.join(os.getcwd(), destination_folder)
-expected_folders = {"left", "right"}
 
 parser = argparse.ArgumentParser()
 parser.add_argument('-skip', action='store_true', help='Skip downloading files')
-args = parser.parse_args()
+parser.add_argument('-serve', action='store_true', help='Render for display clients instead of showing slides')
 
 # =====================================================================================
 
-def clear_contents(download_dir):
+def clear_contents(download_dir, keep=()):
 	if os.path.exists(download_dir):
 		for filename in os.listdir(download_dir):
+			if filename in keep:
+				continue
 			file_path = os.path.join(download_dir, filename)
 			try:
 				if os.path.isfile(file_path) or os.path.islink(file_path):
@@ -45,195 +51,159 @@ def clear_contents(download_dir):
 					shutil.rmtree(file_path)  # Delete folder
 			except Exception as e:
 				print(f"Failed to delete {file_path}. Reason: {e}")
-		print("All contents deleted from '"+download_dir+"' folder.")
+		if keep:
+			print("Cleared '"+download_dir+"' folder, kept " + ", ".join(sorted(keep)))
+		else:
+			print("All contents deleted from '"+download_dir+"' folder.")
 	else:
 		print("'downloads' folder does not exist.")
 
 # =====================================================================================
 
-def unzip_n_check(download_dir):
-	zip_files = [f for f in os.listdir(download_dir) if f.lower().endswith('.zip')]
-	if not zip_files:
-		print("No zip file found in the downloads folder.")
-		exit()
-	zip_path = os.path.join(download_dir, zip_files[0])
-	extract_path = os.path.join(download_dir, "extracted")
-
-	if os.path.exists(extract_path):
-		shutil.rmtree(extract_path)
-	os.makedirs(extract_path, exist_ok=True)
-
-	with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-		zip_ref.extractall(extract_path)
-		print(f"Extracted a file")
-
-	# Check if a single folder was extracted
-	top_items = os.listdir(extract_path)
-	if len(top_items) == 1:
-		single_item_path = os.path.join(extract_path, top_items[0])
-		if os.path.isdir(single_item_path):
-			# Move contents of the folder up one level
-			for item in os.listdir(single_item_path):
-				shutil.move(os.path.join(single_item_path, item), extract_path)
-			shutil.rmtree(single_item_path)
-			print("Flattened zip structure to remove top-level folder.")
-
-	found_folders = set()
-	for item in os.listdir(extract_path):
-		item_path = os.path.join(extract_path, item)
-		if os.path.isdir(item_path):
-			found_folders.add(item.lower())
-
-	if expected_folders.issubset(found_folders):
-		print("Folder structure is valid in the drive")
-		os.remove(zip_path)
-	else:
-		print(f"Folder structure is not valid in the drive")
-
-# =====================================================================================
-
-# Convert PDF
-def convert_pdf_to_png(filepath):
-	if not os.path.isfile(filepath):
-		print(f"File not found: {filepath}")
-		return 0
-
-	filename = os.path.splitext(os.path.basename(filepath))[0]
-	output_prefix = os.path.join(os.path.dirname(filepath), filename)
-
-	command = ["pdftoppm", "-png", filepath, output_prefix]
-
-	try:
-		subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-		return 1
-	except subprocess.CalledProcessError:
-		return 0
-
-# =====================================================================================
-def has_internet():
+async def has_internet(url="http://www.google.com", timeout=5):
+    """Check that the host of url accepts a connection, without blocking the event loop."""
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
     try:
-        response = requests.get("http://www.google.com", timeout=5, stream=True)
-        return response.status_code == 200
-    except requests.RequestException:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, port), timeout)
+    except (OSError, asyncio.TimeoutError):
         return False
+    writer.close()
+    return True
 # =====================================================================================
 
-def get_valid_files(folder_path):
-	valid_extensions = {'.png', '.jpg', '.jpeg', '.pdf'}
-	valid_files = []
-	if not os.path.exists(folder_path):
-		return valid_files
-	for filename in os.listdir(folder_path):
-		file_path = os.path.join(folder_path, filename)
-		if os.path.isfile(file_path):
-			_, ext = os.path.splitext(filename)
-			if ext.lower() in valid_extensions:
-				valid_files.append(file_path)
-	return valid_files
-
-# =====================================================================================
-
-def convert_all_pdfs(folder_path):
-	converted_count = 0
-	pdf_files = []
-	for filename in os.listdir(folder_path):
-		file_path = os.path.join(folder_path, filename)
-		if os.path.isfile(file_path) and filename.lower().endswith('.pdf'):
-			pdf_files.append(file_path)
-	for pdf_path in pdf_files:
-		if not os.path.isfile(pdf_path):
-			print(f"File not found: {pdf_path}")
-			continue
-		filename = os.path.splitext(os.path.basename(pdf_path))[0]
-		output_prefix = os.path.join(os.path.dirname(pdf_path), filename)
-		command = ["pdftoppm", "-png", pdf_path, output_prefix]
-		try:
-			subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-			converted_count += 1
-			print(f"Converted a pdf")
-		except subprocess.CalledProcessError:
-			print(f"Failed to convert: {pdf_path}")
-	return converted_count, pdf_files
-
-# =====================================================================================
-
-def rename_files_sequentially(folder_path):
-	valid_extensions = {'.png', '.jpg', '.jpeg'}
-	files_to_rename = []
-	for filename in os.listdir(folder_path):
-		file_path = os.path.join(folder_path, filename)
-		if os.path.isfile(file_path):
-			_, ext = os.path.splitext(filename)
-			if ext.lower() in valid_extensions:
-				files_to_rename.append((file_path, ext.lower()))
-	files_to_rename.sort(key=lambda x: os.path.getctime(x[0]))
-	for index, (file_path, ext) in enumerate(files_to_rename, start=1):
-		new_name = os.path.join(folder_path, f"{index}{ext}")
-		if file_path != new_name:
-			# If the target file already exists, remove it first
-			if os.path.exists(new_name):
-				os.remove(new_name)
-			os.rename(file_path, new_name)
-			print(f"Renamed: {os.path.basename(file_path)} -> {index}{ext}")
-	return len(files_to_rename)
-
-# =====================================================================================
-
-def delete_invalid_files(folder_path):
-	valid_extensions = {'.png', '.jpg', '.jpeg'}
-	deleted_count = 0
-	
-	for filename in os.listdir(folder_path):
-		file_path = os.path.join(folder_path, filename)
-		if os.path.isfile(file_path):
-			_, ext = os.path.splitext(filename)
-			if ext.lower() not in valid_extensions:
-				os.remove(file_path)
-				print(f"Deleted invalid file: {file_path}")
-				deleted_count += 1
-	return deleted_count
+def get_pdf_options(config, screen_resolution=None):
+	return {
+		# Pages are rasterized at the side cell size of the screen
+		"scale": pdf_scale(screen_resolution),
+		"max_pages": int(config.get("pdf-max-pages", 0)),
+		"workers": int(config.get("pdf-workers", 0)),
+	}
+
+def sync_extracted_folders(pdf_options=None, pools=None):
+	"""Update left and right from the new download, converting only new or changed files."""
+	incoming_path = os.path.join(download_dir, "incoming")
+	if not os.path.exists(incoming_path):
+		print("Incoming folder does not exist.")
+		return 0
+	extract_path = os.path.join(download_dir, "extracted")
+	changes = sync_folders(incoming_path, extract_path, os.path.join(download_dir, MANIFEST_FILE),
+		pdf_options=pdf_options, pools=pools)
+	shutil.rmtree(incoming_path)
+	print(f"Synced {changes} changed file(s)")
+	return changes
 
 # =====================================================================================
 
-def process_folder(folder_path):
-	if not os.path.exists(folder_path):
-		print(f"Folder not found: {folder_path}")
-		return
-	converted_count, pdf_files = convert_all_pdfs(folder_path)
-	print(f"Converted PDF file to PNG")
-	renamed_count = rename_files_sequentially(folder_path)
-	print(f"Renamed image file")
-	for pdf_path in pdf_files:
-		os.remove(pdf_path)
-		print(f"Deleted a PDF after conversion")
-	deleted_count = delete_invalid_files(folder_path)
-	print(f"Deleted additional invalid file")
-
-# =====================================================================================
+def refresh_content(config, screen_resolution=None, metrics=None, pools=None):
+	"""Download, scrape and render a new slide set.
+
+	Frames are rendered at screen_resolution so the player never rescales them.
+	Each stage is timed into metrics (a RefreshMetrics) when one is given, the
+	PDF and render pools are added to pools while they run.
+	Returns True once the result is published as the last-known-good bundle,
+	None when nothing changed and the current bundle already shows it, and
+	False if any stage failed and the current bundle was left alone.
+	"""
+	from downloader import DEFAULT_BUFFER_KB
+	from hhcalendar import download_calendar
+	from browser import close_driver
+	from composite import create_composite, create_columns
+
+	metrics = metrics or RefreshMetrics()
+	# Clear the previous download, keeping processed files, their manifest and
+	# the last good copy of every source
+	with metrics.stage("clear"):
+		clear_contents(download_dir, keep={"extracted", "calendar.png", MANIFEST_FILE, SOURCES_DIR})
+	# Download every source at once, home-url when no sources are configured
+	sources = load_sources(config)
+	sources_dir = os.path.join(download_dir, SOURCES_DIR)
+	with metrics.stage("download") as record:
+		status, record["bytes_downloaded"] = fetch_sources(sources, sources_dir,
+			int(config.get("download-buffer-kb", DEFAULT_BUFFER_KB)) * 1024, int(config.get("source-workers", 4)))
+		# Nothing new anywhere, the current slides are as good as it gets
+		record["ok"] = "fresh" in status.values()
+	if record["ok"]:
+		with metrics.stage("unzip") as record:
+			record["ok"] = ingest_sources(sources, sources_dir, os.path.join(download_dir, "incoming"),
+				int(config.get("zip-max-file-mb", 200)), int(config.get("zip-max-total-mb", 2000))) > 0
+	if not record["ok"]:
+		close_driver()
+		print("Refresh failed, keeping the current slides")
+		return False
+	# Download calendar
+	with metrics.stage("calendar") as record:
+		# The calendar is drawn at the size of the center column
+		calendar_size = (screen_resolution[0] // 3, screen_resolution[1]) if screen_resolution else None
+		calendar = download_calendar("calendar-url", config_file, destination_folder, calendar_size)
+		record["ok"] = calendar is not False
+		record["unchanged"] = calendar is None
+		# Both scrapers are done with the browser for this cycle
+		close_driver()
+	with metrics.stage("process") as record:
+		record["files_processed"] = files = sync_extracted_folders(get_pdf_options(config, screen_resolution), pools)
 
-def process_extracted_folders():
-	"""Process both left and right folders in the extracted directory."""
 	extract_path = os.path.join(download_dir, "extracted")
-	if not os.path.exists(extract_path):
-		print("Extracted folder does not exist.")
-		return
-	
-	# Process left folder if it exists
-	left_folder = os.path.join(extract_path, "left")
-	if os.path.exists(left_folder) and os.path.isdir(left_folder):
-		process_folder(left_folder)
-	else:
-		print("Left folder not found in extracted directory")
-	
-	# Process right folder if it exists
-	right_folder = os.path.join(extract_path, "right") 
-	if os.path.exists(right_folder) and os.path.isdir(right_folder):
-		process_folder(right_folder)
-	else:
-		print("Right folder not found in extracted directory")
+	render_mode = config.get("render-mode", "frames")
+	with metrics.stage("composite") as record:
+		if render_mode == "columns":
+			redrawn = create_columns(frame_size=screen_resolution)
+			frames_dir = os.path.join(extract_path, "columns")
+		else:
+			redrawn, record["render_peak_rss_bytes"] = create_composite(int(config.get("render-workers", 1)),
+				config.get("frame-format", "png"), int(config.get("frame-quality", 90)),
+				int(config.get("png-compress-level", 6)), screen_resolution, int(config.get("render-memory-mb", 0)),
+				pools)
+			frames_dir = os.path.join(extract_path, "comps")
+		record["frames"] = len(os.listdir(frames_dir))
+		record["frames_redrawn"] = redrawn
+	bundle = current_bundle()
+	if not files and calendar is None and not redrawn and bundle and read_bundle(bundle)["mode"] == render_mode:
+		# Same slides as on screen, a new bundle would only restart the show
+		print("Nothing changed, keeping the current slides")
+		return None
+	with metrics.stage("publish"):
+		publish_bundle(frames_dir, render_mode, inputs={
+			"left": os.path.join(extract_path, "left"),
+			"right": os.path.join(extract_path, "right"),
+			"calendar.png": os.path.join(download_dir, "calendar.png"),
+		})
+	return True
+
+def pull_content(config, metrics=None):
+	"""Fetch the current slides from the render node at render-server-url instead of rendering them.
+
+	Returns True once a new bundle is published, None when the local one is
+	already current and False when the render node could not be reached.
+	"""
+	from fleet import pull_bundle
+
+	metrics = metrics or RefreshMetrics()
+	with metrics.stage("download") as record:
+		try:
+			pulled = pull_bundle(config["render-server-url"])
+		except (OSError, ValueError, KeyError) as e:
+			print(f"Could not fetch slides from the render server ({e}), keeping the current slides")
+			record["ok"] = False
+			return False
+		if pulled is None:
+			# Up to date is the usual outcome of a poll, not a failure
+			record["unchanged"] = True
+			return None
+		record["bytes_downloaded"], record["frames"] = pulled
+	return True
 
 # =====================================================================================
 
+def config_resolution():
+	"""SCREEN_RES from config.json as (width, height), None if it is missing or malformed."""
+	try:
+		with open(config_file, 'r') as f:
+			width, height = map(int, json.load(f)["SCREEN_RES"].split('x'))
+		return (width, height)
+	except (OSError, ValueError, KeyError, AttributeError):
+		return None
+
 def get_screen_resolution():
 	try:
 		result = subprocess.run(['xrandr'], stdout=subprocess.PIPE, text=True)
@@ -243,38 +213,67 @@ def get_screen_resolution():
 				width, height = map(int, resolution.split('x'))
 				return (width, height)
 	except (subprocess.SubprocessError, ValueError, IndexError, FileNotFoundError):
-		print("Failed to detect screen resolution, using default 1024x768")
+		pass
+	# No display to ask (e.g. rendering over ssh), use the configured one
+	resolution = config_resolution()
+	if resolution:
+		print(f"Failed to detect screen resolution, using SCREEN_RES {resolution[0]}x{resolution[1]}")
+		return resolution
+	print("Failed to detect screen resolution, using default 1024x768")
 	return (1024, 768)
 
 
+def post_event(*event):
+	"""Hand an event to the supervisor, safe to call from any thread."""
+	if event_loop is None:
+		return
+	try:
+		event_loop.call_soon_threadsafe(events.put_nowait, event)
+	except RuntimeError:
+		pass  # Loop already closed, we are exiting anyway
+
+def handle_key(char):
+	"""Shared by the pynput listener and the built-in slideshow window."""
+	if char.lower() == 'q':
+		print("Quit command received")
+		post_event("quit")
+		return False  # Stop listener
+	elif char.lower() == 'r':
+		print("Restart command received")
+		post_event("restart")  # Refreshes in the background, keep listening
+
 def on_press(key):
-	global exit_flag, restart_flag
 	try:
-		if key.char.lower() == 'q':
-			print("Quit command received")
-			exit_flag = True
-			return False  # Stop listener
-		elif key.char.lower() == 'r':
-			print("Restart command received")
-			restart_flag = True
-			return False  # Stop listener
-	except AttributeError:
+		return handle_key(key.char)
+	except (AttributeError, TypeError):
 		pass  # Ignore special keys
 
 def start_keyboard_listener():
+	from pynput import keyboard
 	listener = keyboard.Listener(on_press=on_press)
 	listener.start()
 	return listener
 
-def signal_handler(sig, frame):
-	global exit_flag
+def signal_handler(sig):
 	print(f"Received signal {sig}, exiting...")
-	exit_flag = True
-
-def playslides(image_dir, screen_resolution=None, t_slide="30"):
-	png_files = glob.glob(os.path.join(image_dir, "*.png"))
+	post_event("quit")
+
+def start_column_player(columns_dir, live_dir, t_slide="30"):
+	"""Assemble frames from pre-rendered columns while the slideshow runs."""
+	from composite import ColumnSet, write_frame, play_columns
+	os.makedirs(live_dir, exist_ok=True)
+	live_path = os.path.join(live_dir, "current.png")
+	columns = ColumnSet(columns_dir)
+	write_frame(columns, 0, live_path)
+	stop_event = threading.Event()
+	player = threading.Thread(target=play_columns, args=(columns, live_path, t_slide, stop_event, 1), daemon=True)
+	player.start()
+	return stop_event
+
+def playslides(image_dir, screen_resolution=None, t_slide="30", live=False):
+	png_files = [f for f in glob.glob(os.path.join(image_dir, "*")) if f.lower().endswith(FRAME_EXTENSIONS)]
 	if not png_files:
-		print("No PNG files found in the specified directory.")
+		print("No frames found in the specified directory.")
 		return None
 	
 	# Get screen resolution if not provided
@@ -291,6 +290,9 @@ def playslides(image_dir, screen_resolution=None, t_slide="30"):
 		"--slideshow-delay", t_slide,  # Seconds delay between slides
 		image_dir
 	]
+	if live:
+		# A single frame rewritten by the column player, reload it on the slide timer
+		cmd[-3:] = ["--reload", t_slide, os.path.join(image_dir, "current.png")]
 	
 	try:
 		process = subprocess.Popen(cmd)
@@ -303,14 +305,53 @@ def playslides(image_dir, screen_resolution=None, t_slide="30"):
 		print(f"Error starting slideshow: {e}")
 		return None
 
-def cleanup(slideshow_process=None):
+def start_engine_show(frames_dir, render_mode, screen_resolution, t_slide, buffer_size=3):
+	"""Hand a slide set to the built-in display engine, starting it if needed."""
+	global display_engine
+	from composite import ColumnSet
+	from slideshow import SlideshowEngine, FolderSource
+
+	if not os.path.isdir(frames_dir):
+		# Nothing rendered yet (first boot), like feh the show starts after the first refresh
+		print("No frames found in the specified directory.")
+		return None
+	if display_engine is None or display_engine.poll() is not None:
+		display_engine = SlideshowEngine(screen_resolution, t_slide, buffer_size, on_key=handle_key)
+	# Columns are assembled by the engine itself, no live file needed
+	source = ColumnSet(frames_dir) if render_mode == "columns" else FolderSource(frames_dir)
+	display_engine.show(source)
+	return display_engine
+
+def start_show(frames_dir, render_mode, screen_resolution, t_slide, player="feh", buffer_size=3):
+	"""Start the slideshow on a folder of frames (or columns), returns the process and column player."""
+	if player == "tk":
+		return start_engine_show(frames_dir, render_mode, screen_resolution, t_slide, buffer_size), None
+	if render_mode == "columns":
+		live_dir = destination_folder + "/extracted/live/"
+		column_player = start_column_player(frames_dir, live_dir, t_slide)
+		return playslides(live_dir, screen_resolution, t_slide, live=True), column_player
+	return playslides(frames_dir, screen_resolution, t_slide), None
+
+def show_bundle(bundle_path, screen_resolution, t_slide, player="feh", buffer_size=3):
+	mode = read_bundle(bundle_path).get("mode", "frames")
+	return start_show(os.path.join(bundle_path, "frames"), mode, screen_resolution, t_slide, player, buffer_size)
+
+def cleanup(slideshow_process=None, column_player=None, close_browser=True):
 	"""Cleanup function for terminating slideshow process"""
 	print("Cleaning up resources...")
+	# Only a refresh loads the browser module, nothing to close otherwise
+	browser = sys.modules.get("browser")
+	if browser and close_browser:
+		# Exiting, a late source download is not worth waiting long for
+		browser.close_driver(timeout=5)
+	if column_player:
+		column_player.set()
 	if slideshow_process and slideshow_process.poll() is None:
 		try:
 			slideshow_process.terminate()
-			time.sleep(0.5)
-			if slideshow_process.poll() is None:
+			try:
+				slideshow_process.wait(0.5)
+			except subprocess.TimeoutExpired:
 				slideshow_process.kill()
 			print("Slideshow process terminated")
 		except Exception as e:
@@ -318,70 +359,276 @@ def cleanup(slideshow_process=None):
 # =====================================================================================
 
 
-if __name__ == '__main__':
-	signal.signal(signal.SIGINT, signal_handler)
-	signal.signal(signal.SIGTERM, signal_handler)
-
-	slideshow_timeout = 12 * 60 * 60  # 12 hours in seconds 
-
-	while True:
-		slideshow_start_time = time.time()
-
-		if exit_flag:
-			print("Exiting slideshow application")
-			break
-		elif restart_flag:
-			# Reset flags at the beginning of each run
-			exit_flag = False
-			restart_flag = False
-
-		if not args.skip:
-			# Clear Existing files
-			clear_contents(download_dir)
-			# Download files from home-url
-			check = download_folder("home-url", config_file, destination_folder)
-			unzip_n_check(download_dir)
-			# Download calendar
-			download_calendar("calendar-url", config_file, destination_folder)
-			process_extracted_folders()
-			create_composite()
+class RefreshWorker(threading.Thread):
+	"""Run refresh_content in the background while the current slides keep playing.
 
+	The working folders under downloads/ act as the staging area, the result only
+	reaches the screen through the atomic flip of bundles/current.
+	"""
+
+	def __init__(self, screen_resolution=None, on_done=None):
+		super().__init__(daemon=True)
+		self.screen_resolution = screen_resolution
+		self.on_done = on_done
+		self.succeeded = False
+		self.changed = False  # Whether new slides were published, False when already current
+		self.pulled = False
+		self.metrics = RefreshMetrics()
+		self.metrics_log = DEFAULT_LOG
+		self.metrics_textfile = None
+		self.pools = []  # Executors of the running stage, cancel() stops them
+
+	def run(self):
+		try:
+			# Re-read the config so edits apply on the next refresh
+			with open(config_file, 'r') as f:
+				config = json.load(f)
+			self.metrics_log = config.get("metrics-log", DEFAULT_LOG)
+			self.metrics_textfile = config.get("metrics-textfile") or None
+			self.pulled = bool(config.get("render-server-url"))
+			if self.pulled:
+				# A display client, the render node has done the work already
+				result = pull_content(config, self.metrics)
+			else:
+				result = refresh_content(config, self.screen_resolution, self.metrics, self.pools)
+			self.succeeded = result is not False
+			self.changed = bool(result)
+		except Exception as e:
+			print(f"Refresh failed ({e}), keeping the current slides")
+		self.metrics.succeeded = self.succeeded
+		self.metrics.changed = self.changed
+		if self.on_done:
+			self.on_done(self)
+
+	def export_metrics(self):
+		"""Log this refresh, called once the new slides are on screen (or were not)."""
+		self.metrics.export(self.metrics_log, self.metrics_textfile)
+
+	def cancel(self):
+		"""Stop the PDF conversion or rendering in progress, nothing of it is published."""
+		for pool in list(self.pools):
+			# A process pool waits for its workers at exit, a frame half drawn is not worth it.
+			# shutdown() forgets them, so they are looked up first
+			processes = list((getattr(pool, "_processes", None) or {}).values())
+			pool.shutdown(wait=False, cancel_futures=True)
+			for process in processes:
+				process.terminate()
+		stop_rasterizing()
+
+def start_current_show(screen_resolution):
+	"""Show the last-known-good bundle, or the working folder before the first publish."""
+	with open(config_file, 'r') as f:
+		config = json.load(f)
+	render_mode = config.get("render-mode", "frames")
+	t_slide = config.get("Slide-timing", "30")
+	player = config.get("player", "feh")
+	buffer_size = int(config.get("preload-frames", 3))
+
+	bundle = current_bundle()
+	if bundle:
+		print(f"Showing slide bundle {os.path.basename(bundle)}")
+		return show_bundle(bundle, screen_resolution, t_slide, player, buffer_size)
+	if render_mode == "columns":
+		frames_dir = destination_folder + "/extracted/columns/"
+	else:
+		frames_dir = destination_folder + "/extracted/comps/"
+	return start_show(frames_dir, render_mode, screen_resolution, t_slide, player, buffer_size)
+
+def swap_show(screen_resolution, old_process, old_player):
+	"""Start the current slides, then stop the old ones so the screen never goes blank."""
+	new_process, new_player = start_current_show(screen_resolution)
+	# The built-in engine switches sets in place, only a replaced player is stopped
+	cleanup(old_process if old_process is not new_process else None, old_player)
+	return new_process, new_player
+
+class Supervisor:
+	"""Event-driven main loop that sleeps until something happens.
+
+	Keys, signals, a finished refresh, the slideshow exiting and the refresh
+	timer all arrive as events on one asyncio queue, so an idle display does
+	not wake up at all.
+	"""
+
+	slideshow_timeout = 12 * 60 * 60  # 12 hours in seconds
+	retry_timeout = 10 * 60  # Try again sooner when a refresh failed
+	show_stage = "slideshow"  # Metrics stage of putting new slides up
+	# Wait before starting an exited slideshow again, doubled while it keeps dying at start
+	restart_delay_min = 0.5
+	restart_delay_max = 60
+
+	def __init__(self, screen_resolution, skip=False):
+		self.screen_resolution = screen_resolution
+		self.skip = skip
+		self.process = None
+		self.player = None
+		self.refresh_worker = None
+		self.timer = None
+		self.tasks = set()
+		self.show_started = 0.0
+		self.restart_delay = self.restart_delay_min
+
+	def show_current(self):
+		"""Put the last-known-good slides up."""
+		self.set_show(*start_current_show(self.screen_resolution))
+
+	def swap_current(self):
+		"""Replace the slides on screen with the current bundle."""
+		self.set_show(*swap_show(self.screen_resolution, self.process, self.player))
+
+	def spawn(self, coro):
+		# The loop only keeps weak references to tasks
+		task = asyncio.get_running_loop().create_task(coro)
+		self.tasks.add(task)
+		task.add_done_callback(self.tasks.discard)
+
+	def set_show(self, process, player):
+		if process is not None and process is not self.process:
+			# Block on the exit in a daemon thread instead of polling the child
+			threading.Thread(target=lambda: (process.wait(), post_event("show-exited", process)),
+				daemon=True).start()
+			self.show_started = asyncio.get_running_loop().time()
+		self.process, self.player = process, player
+
+	def schedule_refresh(self, delay):
+		if self.timer:
+			self.timer.cancel()
+		self.timer = asyncio.get_running_loop().call_later(delay, post_event, "timer")
+
+	def start_refresh(self):
+		if self.refresh_worker is None:
+			self.refresh_worker = RefreshWorker(self.screen_resolution,
+				on_done=lambda worker: post_event("refreshed", worker))
+			self.refresh_worker.start()
+
+	async def refresh_if_online(self):
 		with open(config_file, 'r') as f:
 			config = json.load(f)
+		url = config.get("render-server-url") or config.get("home-url") or "http://www.google.com"
+		if await has_internet(url):
+			print("Slideshow timed out, refreshing in the background...")
+			self.start_refresh()
+		else:
+			print("Slideshow timed out, but no internet. Staying on current slides.")
+			self.schedule_refresh(self.slideshow_timeout)
+
+	def on_refreshed(self, worker):
+		self.refresh_worker = None
+		if worker.succeeded:
+			if worker.changed:
+				with worker.metrics.stage(self.show_stage):
+					self.swap_current()
+			# Asking the render node is cheap, a client checks back at the short interval
+			self.schedule_refresh(self.retry_timeout if worker.pulled else self.slideshow_timeout)
+		else:
+			self.schedule_refresh(self.retry_timeout)
+		worker.export_metrics()
+
+	async def run(self):
+		global events, event_loop
+		events = asyncio.Queue()
+		event_loop = asyncio.get_running_loop()
+		for sig in (signal.SIGINT, signal.SIGTERM):
+			event_loop.add_signal_handler(sig, signal_handler, sig)
+
+		# Put the last-known-good slides up before touching the network
+		self.show_current()
+		if not self.skip:
+			self.start_refresh()
+
+		while True:
+			event = await events.get()
+			kind = event[0]
+			if kind == "quit":
+				break
+			elif kind == "refreshed":
+				self.on_refreshed(event[1])
+			elif kind == "show-exited" and event[1] is self.process:
+				# A background refresh may still be using the browser
+				cleanup(None, self.player, close_browser=self.refresh_worker is None)
+				self.process = self.player = None
+				# A player that ran for a while starts over with the short wait, one that
+				# dies at start (no display, feh missing) is retried less and less often
+				if event_loop.time() - self.show_started > self.restart_delay_max:
+					self.restart_delay = self.restart_delay_min
+				print(f"Slideshow process has ended, starting it again in {self.restart_delay:g}s")
+				event_loop.call_later(self.restart_delay, post_event, "show-restart")
+				self.restart_delay = min(self.restart_delay * 2, self.restart_delay_max)
+			elif kind == "show-restart" and self.process is None:
+				self.show_current()
+			elif kind == "restart":
+				if self.skip:
+					self.swap_current()
+				elif self.refresh_worker is None:
+					print("Refreshing in the background")
+					self.start_refresh()
+			elif kind == "timer" and self.refresh_worker is None:
+				self.spawn(self.refresh_if_online())
+
+		if self.timer:
+			self.timer.cancel()
+		if self.refresh_worker:
+			# Quitting must not wait for a refresh to finish rendering
+			print("Cancelling the refresh in progress")
+			self.refresh_worker.cancel()
+		event_loop = None
+
+class RenderNode(Supervisor):
+	"""Supervisor of a render server: the same refresh cycle without a screen.
+
+	Each published bundle is added to the content-addressed store and served
+	over HTTP, display clients with render-server-url set fetch it from there.
+	"""
+
+	show_stage = "export"
+
+	def __init__(self, screen_resolution, skip=False, port=None):
+		super().__init__(screen_resolution, skip)
+		self.port = port
+
+	def show_current(self):
+		from fleet import export_bundle
+		bundle = current_bundle()
+		if bundle:
+			export_bundle(bundle)
+
+	def swap_current(self):
+		self.show_current()
+
+	async def run(self):
+		from fleet import serve_store, DEFAULT_PORT
+		server = serve_store(port=self.port or DEFAULT_PORT)
+		try:
+			await super().run()
+		finally:
+			server.shutdown()
 
-		t_slide = config.get("Slide-timing", "30")
-		screen_resolution = get_screen_resolution()
-		keyboard_listener = start_keyboard_listener()
-		slideshow_process = None
-
-		print("Slideshow started. Press 'q' to quit or 'r' to restart")
+if __name__ == '__main__':
+	args = parser.parse_args()
 
+	if args.serve:
+		with open(config_file, 'r') as f:
+			port = int(json.load(f).get("render-server-port", 0)) or None
+		# Frames are rendered for the displays, not for whatever screen the node has
+		screen_resolution = config_resolution() or get_screen_resolution()
+		supervisor = RenderNode(screen_resolution, args.skip, port)
+		print(f"Render server started for {screen_resolution[0]}x{screen_resolution[1]} displays")
 		try:
-			slideshow_process = playslides(destination_folder + "/extracted/comps/", screen_resolution, t_slide)
-			while not exit_flag and not restart_flag:
-				time.sleep(0.5)
-				elapsed_time = time.time() - slideshow_start_time
-
-				if slideshow_process and slideshow_process.poll() is not None:
-					print("Slideshow process has ended")
-					break
-
-				if elapsed_time >= slideshow_timeout:
-					if has_internet():
-						print("Slideshow timed out, restarting...")
-						restart_flag = True
-						break
-					else:
-						print("Slideshow timed out, but no internet. Staying on current slides.")
-						slideshow_start_time = time.time()
+			asyncio.run(supervisor.run())
 		finally:
-			cleanup(slideshow_process)
-			if keyboard_listener:
-				keyboard_listener.stop()
-
-		if exit_flag:
-			print("Exiting slideshow application")
-			break
-		if restart_flag:
-			print("Restarting slideshow application")
-			continue
\ No newline at end of file
+			cleanup()
+		sys.exit(0)
+
+	screen_resolution = get_screen_resolution()
+	keyboard_listener = start_keyboard_listener()
+	supervisor = Supervisor(screen_resolution, args.skip)
+
+	print("Slideshow started. Press 'q' to quit or 'r' to restart")
+
+	try:
+		asyncio.run(supervisor.run())
+	finally:
+		cleanup(supervisor.process, supervisor.player)
+		if keyboard_listener:
+			keyboard_listener.stop()
+
+	print("Exiting slideshow application")
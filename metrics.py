@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import socket
+import resource
+from contextlib import contextmanager
+
+DEFAULT_LOG = os.path.join("logs", "refresh.jsonl")
+PREFIX = "campuspulse_refresh"
+
+def reset_peak_rss():
+    """Start a new high-water mark for this process, False where the kernel has no clear_refs."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_bytes():
+    """Peak resident memory of this process since the last reset_peak_rss."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Lifetime peak without /proc, ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class RefreshMetrics:
+    """Timings and counters of one refresh, one entry per stage.
+
+    Wrap each stage in stage(name). The stage counts as failed if it raises or
+    if the caller sets record["ok"] = False. Counters such as bytes_downloaded
+    go into the record returned by the context manager. peak_rss_bytes is
+    reset at the start of each stage, so it covers that stage alone (and the
+    slideshow running in the same process), child processes report their own
+    peak into the record, e.g. render_peak_rss_bytes. succeeded is whether
+    the refresh as a whole worked, changed whether it published new slides
+    (a display client whose slides are already current succeeds unchanged).
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = []
+        self.succeeded = False
+        self.changed = False
+
+    @contextmanager
+    def stage(self, name):
+        record = {"stage": name, "ok": True}
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record["ok"] = False
+            raise
+        finally:
+            record["duration_s"] = round(time.perf_counter() - start, 4)
+            record["peak_rss_bytes"] = peak_rss_bytes()
+            self.stages.append(record)
+
+    def total(self, key):
+        return sum(record.get(key, 0) for record in self.stages)
+
+    def summary(self):
+        return {
+            "host": socket.gethostname(),
+            "started": self.started,
+            "duration_s": round(time.time() - self.started, 4),
+            "ok": self.succeeded,
+            "changed": self.changed,
+            "bytes_downloaded": self.total("bytes_downloaded"),
+            "files_processed": self.total("files_processed"),
+            "frames": self.total("frames"),
+            "peak_rss_bytes": max((record["peak_rss_bytes"] for record in self.stages), default=0),
+            "render_peak_rss_bytes": max((record.get("render_peak_rss_bytes", 0) for record in self.stages),
+                                         default=0),
+            "stages": self.stages,
+        }
+
+    def append_log(self, log_path=DEFAULT_LOG):
+        """Add this refresh as one JSON line."""
+        folder = os.path.dirname(log_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(log_path, "a") as f:
+            f.write(json.dumps(self.summary()) + "\n")
+
+    def write_textfile(self, prom_path):
+        """Replace the node_exporter textfile with the numbers of this refresh."""
+        summary = self.summary()
+        lines = [
+            f"# HELP {PREFIX}_success Whether the last refresh succeeded.",
+            f"# TYPE {PREFIX}_success gauge",
+            f"{PREFIX}_success {int(summary['ok'])}",
+            f"# HELP {PREFIX}_changed Whether the last refresh published new slides.",
+            f"# TYPE {PREFIX}_changed gauge",
+            f"{PREFIX}_changed {int(summary['changed'])}",
+            f"# HELP {PREFIX}_timestamp_seconds Start of the last refresh.",
+            f"# TYPE {PREFIX}_timestamp_seconds gauge",
+            f"{PREFIX}_timestamp_seconds {summary['started']:.0f}",
+            f"# HELP {PREFIX}_duration_seconds Wall time of the last refresh.",
+            f"# TYPE {PREFIX}_duration_seconds gauge",
+            f"{PREFIX}_duration_seconds {summary['duration_s']}",
+            f"# HELP {PREFIX}_bytes_downloaded Size of the last download.",
+            f"# TYPE {PREFIX}_bytes_downloaded gauge",
+            f"{PREFIX}_bytes_downloaded {summary['bytes_downloaded']}",
+            f"# HELP {PREFIX}_files_processed Files added, changed or removed by the last sync.",
+            f"# TYPE {PREFIX}_files_processed gauge",
+            f"{PREFIX}_files_processed {summary['files_processed']}",
+            f"# HELP {PREFIX}_frames Frames in the last rendered slide set.",
+            f"# TYPE {PREFIX}_frames gauge",
+            f"{PREFIX}_frames {summary['frames']}",
+            f"# HELP {PREFIX}_peak_rss_bytes Peak resident memory of the display process during the last refresh.",
+            f"# TYPE {PREFIX}_peak_rss_bytes gauge",
+            f"{PREFIX}_peak_rss_bytes {summary['peak_rss_bytes']}",
+            f"# HELP {PREFIX}_render_peak_rss_bytes Peak resident memory of one render worker in the last refresh.",
+            f"# TYPE {PREFIX}_render_peak_rss_bytes gauge",
+            f"{PREFIX}_render_peak_rss_bytes {summary['render_peak_rss_bytes']}",
+            f"# HELP {PREFIX}_stage_duration_seconds Wall time of each stage of the last refresh.",
+            f"# TYPE {PREFIX}_stage_duration_seconds gauge",
+        ]
+        lines += [f'{PREFIX}_stage_duration_seconds{{stage="{record["stage"]}"}} {record["duration_s"]}'
+                  for record in self.stages]
+        lines += [
+            f"# HELP {PREFIX}_stage_peak_rss_bytes Peak resident memory of the display process in each stage.",
+            f"# TYPE {PREFIX}_stage_peak_rss_bytes gauge",
+        ]
+        lines += [f'{PREFIX}_stage_peak_rss_bytes{{stage="{record["stage"]}"}} {record["peak_rss_bytes"]}'
+                  for record in self.stages]
+        lines += [
+            f"# HELP {PREFIX}_stage_success Whether each stage of the last refresh succeeded.",
+            f"# TYPE {PREFIX}_stage_success gauge",
+        ]
+        lines += [f'{PREFIX}_stage_success{{stage="{record["stage"]}"}} {int(record["ok"])}'
+                  for record in self.stages]
+
+        # node_exporter may read at any moment, so never leave a half-written file
+        tmp_path = prom_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, prom_path)
+
+    def export(self, log_path=DEFAULT_LOG, prom_path=None):
+        """Write the JSON line and the textfile, never failing the caller."""
+        try:
+            if log_path:
+                self.append_log(log_path)
+            if prom_path:
+                self.write_textfile(prom_path)
+        except OSError as e:
+            print(f"Could not write refresh metrics: {e}")
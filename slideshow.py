@@ -0,0 +1,228 @@
+import os
+import re
+import time
+import queue
+import threading
+import subprocess
+from PIL import Image
+
+from bundle import FRAME_EXTENSIONS
+
+def natural_key(name):
+    # 2.png before 10.png
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+class FolderSource:
+    """Frames stored as image files in a folder, shown in numeric order."""
+
+    def __init__(self, folder):
+        # A folder that does not exist yet is an empty show
+        names = os.listdir(folder) if os.path.isdir(folder) else []
+        names = [f for f in names if f.lower().endswith(FRAME_EXTENSIONS)]
+        self.paths = [os.path.join(folder, f) for f in sorted(names, key=natural_key)]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def frame(self, index):
+        with Image.open(self.paths[index % len(self.paths)]) as img:
+            return img.convert('RGB')
+
+def fit_to_screen(img, screen_resolution):
+    """Scale a frame to fit the screen and letterbox it, like feh --auto-zoom."""
+    screen_w, screen_h = screen_resolution
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    scale = min(screen_w / img.width, screen_h / img.height)
+    size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+    if size != img.size:
+        img = img.resize(size, Image.BICUBIC, reducing_gap=2.0)
+    if size == (screen_w, screen_h):
+        return img
+    canvas = Image.new('RGB', (screen_w, screen_h), 'black')
+    canvas.paste(img, ((screen_w - size[0]) // 2, (screen_h - size[1]) // 2))
+    return canvas
+
+class SlideshowEngine:
+    """Fullscreen Tk slideshow that decodes upcoming frames ahead of time.
+
+    A preloader thread keeps the next buffer_size frames decoded and scaled to
+    the screen in a small ring buffer, so a transition is only a widget update.
+    show() switches to a new frame source without restarting anything. The
+    object mimics the parts of subprocess.Popen that main uses (poll, wait,
+    terminate, kill) so it can stand in for the feh process.
+    """
+
+    def __init__(self, screen_resolution, t_slide, buffer_size=3, on_key=None):
+        self.screen_resolution = tuple(screen_resolution)
+        self.t_slide = float(t_slide)
+        self.buffer_size = max(1, buffer_size)
+        self.on_key = on_key
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._source = None
+        self._generation = 0
+        self._index = 0
+        self._ring = {}
+        self._commands = queue.Queue()
+        self._stopped = threading.Event()
+        # The Tk root once its loop runs, and whether the loop waits for the current frame
+        self._root = None
+        self._starved = False
+
+        threading.Thread(target=self._preload, daemon=True).start()
+        self._thread = threading.Thread(target=self._run_tk, daemon=True)
+        self._thread.start()
+
+    # Popen-like interface ---------------------------------------------------
+
+    def poll(self):
+        return None if self._thread.is_alive() else 0
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise subprocess.TimeoutExpired("slideshow", timeout)
+        return 0
+
+    def terminate(self):
+        self._commands.put("quit")
+        self._wake()
+
+    def kill(self):
+        self.terminate()
+
+    # Frame management ------------------------------------------------------
+
+    def show(self, source):
+        """Switch to a new set of frames at the next tick, starting from the first."""
+        with self._cond:
+            self._source = source
+            self._generation += 1
+            self._index = 0
+            self._ring.clear()
+            self._cond.notify_all()
+        self._commands.put("switch")
+        self._wake()
+
+    def _wake(self):
+        """Have the Tk loop look at its commands and the ring now, from any thread."""
+        root = self._root
+        if root is None:
+            return  # The first tick reads the commands anyway
+        try:
+            # Tkinter passes this to the Tk thread, which is the only one allowed to touch the window
+            root.event_generate("<<Wake>>", when="tail")
+        except Exception:
+            pass  # The window is already gone
+
+    def _wanted(self):
+        count = len(self._source)
+        return [(self._index + k) % count for k in range(min(self.buffer_size, count))]
+
+    def _preload(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                while not self._stopped.is_set():
+                    if self._source is not None and len(self._source):
+                        missing = [i for i in self._wanted() if i not in self._ring]
+                        if missing:
+                            break
+                    self._cond.wait()
+                if self._stopped.is_set():
+                    return
+                source, generation, index = self._source, self._generation, missing[0]
+            try:
+                img = fit_to_screen(source.frame(index), self.screen_resolution)
+            except Exception as e:
+                print(f"Could not load frame {index}: {e}")
+                img = Image.new('RGB', self.screen_resolution, 'black')
+            wake = False
+            with self._cond:
+                if generation == self._generation and index in self._wanted():
+                    self._ring[index] = img
+                    self._cond.notify_all()
+                    if self._starved and index == self._index:
+                        self._starved = False
+                        wake = True
+            if wake:
+                self._wake()
+
+    def _next_frame(self):
+        """Take the current frame from the ring and advance, None if it is not decoded yet."""
+        with self._cond:
+            if self._source is None or self._index not in self._ring:
+                # The preloader wakes the Tk loop once this frame is ready
+                self._starved = True
+                return None
+            img = self._ring.pop(self._index)
+            self._index = (self._index + 1) % len(self._source)
+            # Drop whatever fell out of the window and wake the preloader
+            for i in list(self._ring):
+                if i not in self._wanted():
+                    del self._ring[i]
+            self._cond.notify_all()
+            return img
+
+    # Tk side ---------------------------------------------------------------
+
+    def _run_tk(self):
+        # Whatever happens here, including Tk failing to open the display,
+        # the preloader has to be released
+        try:
+            self._show_window()
+        except Exception as e:
+            print(f"Slideshow window failed: {e}")
+        finally:
+            self._stopped.set()
+            with self._cond:
+                self._cond.notify_all()
+
+    def _show_window(self):
+        import tkinter as tk
+        from PIL import ImageTk
+
+        root = tk.Tk()
+        root.title("CampusPulse")
+        root.configure(bg='black', cursor='none')
+        root.attributes('-fullscreen', True)
+        label = tk.Label(root, bg='black', borderwidth=0)
+        label.pack(fill='both', expand=True)
+        if self.on_key:
+            root.bind('<Key>', lambda event: event.char and self.on_key(event.char))
+
+        state = {"photo": None, "due": 0.0, "timer": None}
+
+        def tick(event=None):
+            # Runs when the next slide is due or when _wake() asks, never on a poll
+            self._root = root
+            if state["timer"]:
+                root.after_cancel(state["timer"])
+                state["timer"] = None
+            try:
+                while True:
+                    command = self._commands.get_nowait()
+                    if command == "quit":
+                        self._root = None
+                        root.destroy()
+                        return
+                    if command == "switch":
+                        state["due"] = 0.0
+            except queue.Empty:
+                pass
+
+            if time.monotonic() >= state["due"]:
+                img = self._next_frame()
+                if img is None:
+                    return  # Not decoded yet, the preloader wakes us
+                # Keep a reference, Tk does not hold on to the PhotoImage
+                state["photo"] = ImageTk.PhotoImage(img)
+                label.configure(image=state["photo"])
+                state["due"] = time.monotonic() + self.t_slide
+            delay = max(0, round((state["due"] - time.monotonic()) * 1000))
+            state["timer"] = root.after(delay, tick)
+
+        root.bind('<<Wake>>', tick)
+        root.after(0, tick)
+        root.mainloop()
@@ -0,0 +1,163 @@
+import os
+import re
+import shutil
+import time
+import tempfile
+import zipfile
+import threading
+
+from ingest import ingest_zip
+
+SOURCES_DIR = "sources"
+LAST_GOOD = "last-good.zip"
+SIDES = ("left", "right")
+# On top of a source's own timeout, covers page loads and connection setup
+FETCH_GRACE = 30
+# Staging folders left behind by a crash are removed after this many seconds
+STALE_STAGING = 24 * 60 * 60
+
+def load_sources(config):
+    """The content sources of config.json, or home-url as the single source feeding both sides.
+
+    Each source is {"name", "url", "side": "left" | "right" | "both", "timeout"}.
+    """
+    default_timeout = int(config.get("download-timeout", 120))
+    entries = config.get("sources") or [{"name": "home", "url": config.get("home-url", ""), "side": "both"}]
+    sources = []
+    for n, entry in enumerate(entries):
+        name = re.sub(r"[^\w.-]", "_", entry.get("name") or f"source{n + 1}")
+        side = entry.get("side", "both")
+        if side not in SIDES + ("both",):
+            print(f"Source {name}: unknown side '{side}', skipping it")
+            continue
+        if not entry.get("url"):
+            print(f"Source {name}: no url, skipping it")
+            continue
+        sources.append({"name": name, "url": entry["url"], "side": side,
+                        "timeout": int(entry.get("timeout", default_timeout))})
+    return sources
+
+def source_folders(source):
+    """Map folders of a source's zip to the sides they feed."""
+    if source["side"] == "both":
+        return {side: side for side in SIDES}
+    # A single-side share may hold its files at the root or in a folder named after the side
+    return {"": source["side"], source["side"]: source["side"]}
+
+def fetch_source(source, root, buffer_size):
+    """Download one source and keep it as its last good copy. Returns the zip size, 0 on failure."""
+    from downloader import download_url
+
+    source_dir = os.path.join(root, source["name"])
+    os.makedirs(source_dir, exist_ok=True)
+    for name in os.listdir(source_dir):
+        path = os.path.join(source_dir, name)
+        if name.startswith("incoming-") and time.time() - os.path.getmtime(path) > STALE_STAGING:
+            shutil.rmtree(path, ignore_errors=True)
+    # Every attempt gets its own folder, one that ran late may still be writing to its own
+    staging = tempfile.mkdtemp(prefix="incoming-", dir=source_dir)
+    try:
+        if not download_url(source["url"], os.path.abspath(staging), buffer_size, source["timeout"]):
+            return 0
+        zips = [f for f in os.listdir(staging) if f.lower().endswith('.zip')]
+        if not zips or not zipfile.is_zipfile(os.path.join(staging, zips[0])):
+            print(f"Source {source['name']}: no zip file in the download")
+            return 0
+        # Replaced atomically so a reader never sees a half-copied zip
+        last_good = os.path.join(source_dir, LAST_GOOD)
+        os.replace(os.path.join(staging, zips[0]), last_good)
+        return os.path.getsize(last_good)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+def fetch_sources(sources, root, buffer_size, workers=4):
+    """Download all sources in parallel, each bounded by its own timeout.
+
+    Returns {name: "fresh" | "stale" | "missing"} and the bytes downloaded. A
+    source that failed or ran out of time falls back to its last good copy
+    (stale), so the refresh takes as long as the slowest source, not the sum.
+    """
+    os.makedirs(root, exist_ok=True)
+    workers = max(1, workers)
+    sizes = {}
+    done = threading.Condition()
+
+    def fetch(source):
+        try:
+            size = fetch_source(source, root, buffer_size)
+        except Exception as e:
+            print(f"Source {source['name']} failed: {e}")
+            size = 0
+        with done:
+            sizes[source["name"]] = size
+            done.notify_all()
+
+    # At most workers sources run at once. A source's clock starts when it gets
+    # a slot, so one queued behind slow sources still has its whole timeout.
+    # Daemon threads: a source still running when its time is up is left to
+    # finish in the background (it only ever replaces its own last good copy),
+    # its slot goes to the next source and it never holds up the exit
+    queued = list(sources)
+    running = {}  # name -> deadline
+    with done:
+        while queued or running:
+            now = time.monotonic()
+            for name, deadline in list(running.items()):
+                # Downloads have their own socket timeouts, this bounds a source that keeps trickling
+                if name in sizes or deadline <= now:
+                    del running[name]
+            while queued and len(running) < workers:
+                source = queued.pop(0)
+                running[source["name"]] = now + source["timeout"] + FETCH_GRACE
+                threading.Thread(target=fetch, args=(source,), daemon=True).start()
+            if running:
+                done.wait(min(running.values()) - now)
+
+    status = {}
+    downloaded = 0
+    for source in sources:
+        size = sizes.get(source["name"])
+        if size is None:
+            print(f"Source {source['name']} timed out")
+            size = 0
+        downloaded += size
+        if size:
+            status[source["name"]] = "fresh"
+        elif os.path.exists(os.path.join(root, source["name"], LAST_GOOD)):
+            status[source["name"]] = "stale"
+        else:
+            status[source["name"]] = "missing"
+    print("Sources: " + ", ".join(f"{name} {state}" for name, state in status.items()))
+    return status, downloaded
+
+def ingest_sources(sources, root, incoming_path, max_file_mb=200, max_total_mb=2000):
+    """Merge the last good copy of every source into incoming_path/left and right.
+
+    With more than one source, files are prefixed with the source name so they
+    cannot collide. Returns the number of sources that made it in.
+    """
+    if os.path.exists(incoming_path):
+        shutil.rmtree(incoming_path)
+    os.makedirs(incoming_path)
+    merged = 0
+    for source in sources:
+        zip_path = os.path.join(root, source["name"], LAST_GOOD)
+        if not os.path.exists(zip_path):
+            continue
+        extract_path = os.path.join(root, source["name"], "extracted")
+        folders = source_folders(source)
+        found = ingest_zip(zip_path, extract_path, SIDES, max_file_mb, max_total_mb, folders=folders)
+        if source["side"] == "both" and not set(SIDES).issubset(found):
+            print(f"Source {source['name']}: folder structure is not valid, expected left and right")
+            continue
+        prefix = f"{source['name']}-" if len(sources) > 1 else ""
+        for side in SIDES:
+            side_dir = os.path.join(extract_path, side)
+            if not os.path.isdir(side_dir):
+                continue
+            os.makedirs(os.path.join(incoming_path, side), exist_ok=True)
+            for name in os.listdir(side_dir):
+                os.replace(os.path.join(side_dir, name), os.path.join(incoming_path, side, prefix + name))
+        shutil.rmtree(extract_path, ignore_errors=True)
+        merged += 1
+    return merged
@@ -6,17 +6,8 @@
 # echo "===== Started at $(date) =====" >> "$LOG_FILE"
 echo "===== Started at $(date) ====="
 
-# Try to connect for up to 10 seconds
-SECONDS=0
-while ! ping -c 1 -W 1 8.8.8.8 &> /dev/null; do
-    if (( SECONDS >= 10 )); then
-        echo "No internet after 10 seconds, continuing at $(date)"
-        break
-    fi
-    sleep 1
-done
-
-echo "===== Started again at $(date) ====="
+# No need to wait for the network, main.py shows the last-known-good
+# slides straight away and refreshes them once a download succeeds
 
 source ~/.campuspulse/bin/activate
 cd /home/$(ls /home | head -n 1)/Desktop/campuspulse/
@@ -0,0 +1,218 @@
+import os
+import json
+import shutil
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_FILE = "manifest.json"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+PDF_CACHE_DIR = os.path.join("cache", "pdf")
+
+# Long side of a rasterized page, the 800x600 side cell never needs more
+DEFAULT_PDF_SCALE = 800
+
+# pdftoppm processes still running, stop_rasterizing() ends them on quit
+_rasterizing = set()
+
+def pdf_scale(frame_size=None):
+    """Long side of a rasterized page for the side cells of a frame_size frame."""
+    if frame_size is None:
+        return DEFAULT_PDF_SCALE
+    width, height = frame_size
+    # The widest side column (see composite.frame_layout) by half the frame height
+    return max(width - 2 * (width // 3), height // 2)
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, manifest_path):
+    # Write to a temp file first so a crash never leaves a half-written manifest
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def rasterize_pdf(pdf_path, output_prefix, scale=DEFAULT_PDF_SCALE, max_pages=0):
+    """Render PDF pages straight at display size, at most max_pages of them (0 for all)."""
+    command = ["pdftoppm", "-png", "-scale-to", str(scale)]
+    if max_pages:
+        command += ["-l", str(max_pages)]
+    command += [pdf_path, output_prefix]
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        print(f"Failed to convert: {pdf_path}")
+        return False
+    _rasterizing.add(process)
+    try:
+        returncode = process.wait()
+    finally:
+        _rasterizing.discard(process)
+    if returncode:
+        print(f"Failed to convert: {pdf_path}")
+        return False
+    return True
+
+def stop_rasterizing():
+    """Terminate every running pdftoppm, the conversions waiting on them fail."""
+    for process in list(_rasterizing):
+        process.terminate()
+
+def link_or_copy(src, dst):
+    # A hard link costs no extra write on the SD card, copy across filesystems
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def pdf_cache_key(digest, scale, max_pages):
+    return f"{digest[:16]}-{scale}-{max_pages or 'all'}"
+
+def cached_pdf_pages(pdf_path, digest, output_dir, scale, max_pages, cache_dir=PDF_CACHE_DIR):
+    """Rasterize a PDF once per content hash and link its pages into output_dir."""
+    page_dir = os.path.join(cache_dir, pdf_cache_key(digest, scale, max_pages))
+    if not os.path.isdir(page_dir):
+        tmp_dir = page_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        if not rasterize_pdf(pdf_path, os.path.join(tmp_dir, "page"), scale, max_pages):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return []
+        os.replace(tmp_dir, page_dir)
+    else:
+        print(f"Using cached pages for {os.path.basename(pdf_path)}")
+
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    outputs = []
+    for page in sorted(os.listdir(page_dir)):
+        # page-1.png -> <stem>-1.png, the names pdftoppm would have produced
+        name = stem + page[len("page"):]
+        link_or_copy(os.path.join(page_dir, page), os.path.join(output_dir, name))
+        outputs.append(name)
+    return outputs
+
+def prune_pdf_cache(manifest, cache_dir=PDF_CACHE_DIR):
+    """Forget rasterized pages of PDFs that are no longer part of the content."""
+    if not os.path.isdir(cache_dir):
+        return
+    live = {entry["hash"][:16] for entry in manifest.values()}
+    for name in os.listdir(cache_dir):
+        if name.split("-", 1)[0] not in live:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+def remove_outputs(outputs, output_dir):
+    for name in outputs:
+        path = os.path.join(output_dir, name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+def sync_side(side, incoming_dir, output_dir, manifest, pdf_options=None, pools=None):
+    """Bring output_dir in line with incoming_dir, touching only what changed.
+
+    The PDF thread pool is added to pools (a list) while it runs, so the
+    caller can cancel it.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pdf_options = pdf_options or {}
+    added = changed = removed = 0
+    seen = set()
+    pending_pdfs = []
+    scale = pdf_options.get("scale", DEFAULT_PDF_SCALE)
+    max_pages = pdf_options.get("max_pages", 0)
+
+    for name in sorted(os.listdir(incoming_dir)):
+        source_path = os.path.join(incoming_dir, name)
+        if not os.path.isfile(source_path):
+            continue
+        if not name.lower().endswith(IMAGE_EXTENSIONS + ('.pdf',)):
+            continue
+        key = f"{side}/{name}"
+        seen.add(key)
+
+        size = os.path.getsize(source_path)
+        entry = manifest.get(key)
+        digest = file_hash(source_path)
+        # PDF pages also depend on the size and page limit they were rasterized at
+        render = pdf_cache_key(digest, scale, max_pages) if name.lower().endswith('.pdf') else None
+        if entry and entry["size"] == size and entry["hash"] == digest and entry.get("render") == render:
+            outputs_present = all(os.path.isfile(os.path.join(output_dir, o)) for o in entry["outputs"])
+            # An entry without outputs failed to convert last time, try it again
+            if entry["outputs"] and outputs_present:
+                continue
+
+        if entry:
+            remove_outputs(entry["outputs"], output_dir)
+            changed += 1
+            print(f"Changed: {key}")
+        else:
+            added += 1
+            print(f"Added: {key}")
+
+        manifest[key] = {
+            "hash": digest,
+            "size": size,
+            "source": name,
+            "outputs": [],
+        }
+        if render:
+            manifest[key]["render"] = render
+            pending_pdfs.append((key, source_path, digest))
+        else:
+            os.replace(source_path, os.path.join(output_dir, name))
+            manifest[key]["outputs"] = [name]
+
+    # pdftoppm runs as a subprocess, so threads are enough to use every core
+    with ThreadPoolExecutor(max_workers=pdf_options.get("workers") or os.cpu_count()) as pool:
+        if pools is not None:
+            pools.append(pool)
+        results = pool.map(lambda job: cached_pdf_pages(job[1], job[2], output_dir, scale, max_pages),
+                           pending_pdfs)
+        for (key, _, _), outputs in zip(pending_pdfs, results):
+            manifest[key]["outputs"] = outputs
+    if pools is not None:
+        pools.remove(pool)
+
+    for key in [k for k in manifest if k.startswith(side + "/") and k not in seen]:
+        remove_outputs(manifest.pop(key)["outputs"], output_dir)
+        removed += 1
+        print(f"Removed: {key}")
+
+    # Drop anything in the output folder that no manifest entry produced
+    known = {o for k, e in manifest.items() if k.startswith(side + "/") for o in e["outputs"]}
+    for name in os.listdir(output_dir):
+        if name not in known and os.path.isfile(os.path.join(output_dir, name)):
+            os.remove(os.path.join(output_dir, name))
+
+    return added, changed, removed
+
+def sync_folders(incoming_path, extract_path, manifest_path, sides=("left", "right"), pdf_options=None,
+                 pools=None):
+    """Diff the freshly unzipped folders against the manifest and update the outputs."""
+    manifest = load_manifest(manifest_path)
+    total = 0
+    for side in sides:
+        incoming_dir = os.path.join(incoming_path, side)
+        if not os.path.isdir(incoming_dir):
+            print(f"{side.capitalize()} folder not found in the download, keeping current files")
+            continue
+        added, changed, removed = sync_side(side, incoming_dir, os.path.join(extract_path, side),
+                                            manifest, pdf_options, pools)
+        print(f"{side}: {added} added, {changed} changed, {removed} removed")
+        total += added + changed + removed
+    save_manifest(manifest, manifest_path)
+    prune_pdf_cache(manifest)
+    return total
@@ -0,0 +1,168 @@
+import io
+import os
+import json
+import zipfile
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from downloader import download_sharepoint_direct
+
+COOKIE = "FedAuth=guest-token"
+WEB = "/personal/someone"
+FOLDER = WEB + "/Documents/Share"
+
+def make_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_ref:
+        zip_ref.writestr("Share/left/1.png", os.urandom(200_000))
+        zip_ref.writestr("Share/right/1.png", os.urandom(200_000))
+    return buffer.getvalue()
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answers like a SharePoint "Anyone with the link" share.
+
+    A share link redirects with a guest cookie: a file link with download=1
+    to the file, anything else to the web viewer. The file and the REST API
+    refuse requests without the cookie. The first full response of the zip
+    is cut off halfway, like a dropped connection.
+    """
+    body = b""
+    files = {}
+    requests = []
+    drop_first = True
+
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Set-Cookie", COOKIE + "; Path=/; HttpOnly")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        range_header = self.headers.get("Range")
+        cookie = self.headers.get("Cookie")
+        type(self).requests.append((parts.path, cookie, range_header))
+
+        if parts.path.startswith("/:u:/"):
+            if query.get("download") == ["1"]:
+                return self.redirect(WEB + "/Documents/context.zip")
+            return self.redirect(f"{WEB}/_layouts/15/onedrive.aspx?id={FOLDER}/context.zip&parent={FOLDER}")
+        if parts.path.startswith("/:f:/"):
+            return self.redirect(f"{WEB}/_layouts/15/onedrive.aspx?id={FOLDER}")
+        if parts.path.endswith("/onedrive.aspx"):
+            return self.send_body(b"<html><body>Shared folder viewer</body></html>", "text/html; charset=utf-8")
+        if cookie != COOKIE:
+            return self.send_body(b"Access denied", "text/plain", 403)
+
+        if parts.path.startswith(WEB + "/_api/web/"):
+            path = query["@p"][0][1:-1].replace("''", "'")
+            if "GetFolderByServerRelativeUrl" in parts.path:
+                listing = self.listing(path)
+                return self.send_body(json.dumps(listing).encode(), "application/json;odata=nometadata")
+            return self.send_body(type(self).files[path], "application/octet-stream")
+
+        body = type(self).body
+        start = int(range_header.split("=")[1].rstrip("-")) if range_header else 0
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(len(body) - start))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.end_headers()
+        if type(self).drop_first and not start:
+            type(self).drop_first = False
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+    def listing(self, path):
+        def entry(name):
+            return {"Name": name.rsplit("/", 1)[1], "ServerRelativeUrl": name}
+        children = [p for p in type(self).files if p.rsplit("/", 1)[0] == path]
+        folders = {p.rsplit("/", 1)[0] for p in type(self).files if p.rsplit("/", 2)[0] == path and p not in children}
+        return {"Name": path.rsplit("/", 1)[1], "ServerRelativeUrl": path,
+                "Files": [entry(p) for p in sorted(children)], "Folders": [entry(p) for p in sorted(folders)]}
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stand_in():
+    StandIn.body = make_zip()
+    StandIn.files = {
+        f"{FOLDER}/left/1.png": os.urandom(100_000),
+        f"{FOLDER}/left/O'Brien.pdf": os.urandom(50_000),
+        f"{FOLDER}/right/1.jpg": os.urandom(100_000),
+        f"{FOLDER}/right/notes.docx": os.urandom(10_000),
+        f"{FOLDER}/right/old/1.png": os.urandom(10_000),
+        f"{FOLDER}/home.png": os.urandom(20_000),
+    }
+    StandIn.requests = []
+    StandIn.drop_first = True
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+@pytest.fixture(autouse=True)
+def fresh_session(monkeypatch):
+    # The guest cookie must come from this test's redirect, not an earlier one
+    monkeypatch.setattr("downloader._session", None)
+
+def test_file_link_follows_the_redirect_and_resumes_after_a_dropped_connection(stand_in, tmp_path):
+    # Small chunks, so part of the cut-off body reaches the .part file
+    url = stand_in + "/:u:/g/personal/someone/EcontextZip?e=abc"
+    assert download_sharepoint_direct(url, str(tmp_path), buffer_size=64 * 1024) == 1
+    with open(tmp_path / "context.zip", "rb") as f:
+        assert f.read() == StandIn.body
+    zip_requests = [r for r in StandIn.requests if r[0].endswith("/context.zip")]
+    # The guest cookie from the redirect went along with every request for the file
+    assert all(cookie == COOKIE for _, cookie, _ in zip_requests)
+    # The second request picked up where the first one stopped
+    assert zip_requests[0][2] is None
+    offset = int(zip_requests[1][2].split("=")[1].rstrip("-"))
+    assert 0 < offset <= len(StandIn.body) // 2
+
+def test_folder_link_is_fetched_over_the_rest_api(stand_in, tmp_path):
+    url = stand_in + "/:f:/g/personal/someone/EShareFolder?e=abc"
+    assert download_sharepoint_direct(url, str(tmp_path)) == 1
+    with zipfile.ZipFile(tmp_path / "context.zip") as zip_ref:
+        members = {name: zip_ref.read(name) for name in zip_ref.namelist()}
+    # Laid out like the viewer's zip, without what ingest would skip anyway
+    assert members == {
+        "Share/home.png": StandIn.files[f"{FOLDER}/home.png"],
+        "Share/left/1.png": StandIn.files[f"{FOLDER}/left/1.png"],
+        "Share/left/O'Brien.pdf": StandIn.files[f"{FOLDER}/left/O'Brien.pdf"],
+        "Share/right/1.jpg": StandIn.files[f"{FOLDER}/right/1.jpg"],
+    }
+    api_requests = [r for r in StandIn.requests if "/_api/" in r[0]]
+    assert api_requests and all(cookie == COOKIE for _, cookie, _ in api_requests)
+    assert sorted(os.listdir(tmp_path)) == ["context.zip"]
+
+def test_folder_link_without_the_guest_cookie_fails(stand_in, tmp_path, monkeypatch):
+    from downloader import get_session
+    # A share that stopped setting the cookie, the REST calls are refused
+    monkeypatch.setattr(get_session().cookies, "set_cookie", lambda *args, **kwargs: None)
+    url = stand_in + "/:f:/g/personal/someone/EShareFolder?e=abc"
+    assert download_sharepoint_direct(url, str(tmp_path)) == 0
+    assert os.listdir(tmp_path) == []
+
+def test_web_page_instead_of_a_zip_is_rejected(stand_in, tmp_path):
+    # Without download=1 the share answers with its viewer, which must not pass for a zip
+    from downloader import download_file
+    url = stand_in + "/:u:/g/personal/someone/EcontextZip?e=abc"
+    assert download_file(url, str(tmp_path / "context.zip")) == 0
+    assert not os.path.exists(tmp_path / "context.zip")
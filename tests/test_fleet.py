@@ -0,0 +1,60 @@
+import os
+import json
+
+import pytest
+
+from bundle import publish_bundle, current_bundle, read_bundle
+from fleet import export_bundle, serve_store, pull_bundle, MANIFEST_FILE
+
+@pytest.fixture
+def render_node(tmp_path):
+    frames = tmp_path / "render" / "comps"
+    frames.mkdir(parents=True)
+    for n in range(3):
+        (frames / f"{n}.png").write_bytes(os.urandom(50_000))
+    bundle = publish_bundle(str(frames), "comps", root=str(tmp_path / "render" / "bundles"))
+    store = tmp_path / "render" / "store"
+    export_bundle(bundle, store=str(store))
+    server = serve_store(str(store), host="127.0.0.1", port=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}", store, frames
+    server.shutdown()
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # The display client keeps its bundles, cache and staging relative to the working directory
+    path = tmp_path / "client"
+    path.mkdir()
+    monkeypatch.chdir(path)
+    return path
+
+def test_pull_publishes_the_served_bundle(render_node, client):
+    url, store, frames = render_node
+    downloaded, count = pull_bundle(url, cache="objects", staging="pulled")
+    assert count == 3 and downloaded == 3 * 50_000
+    bundle = current_bundle()
+    for name in os.listdir(frames):
+        with open(os.path.join(bundle, "frames", name), "rb") as f:
+            assert f.read() == (frames / name).read_bytes()
+    with open(store / MANIFEST_FILE) as f:
+        assert read_bundle(bundle)["source"] == json.load(f)["version"]
+    # Nothing new on the render node, nothing to do
+    assert pull_bundle(url, cache="objects", staging="pulled") is None
+
+@pytest.mark.parametrize("frame", [
+    {"name": "../escaped.png"},
+    {"name": "/tmp/escaped.png"},
+    {"name": "0.sh"},
+    {"object": "../../manifest.json"},
+    {"object": "0" * 64 + "/x.png"},
+])
+def test_manifest_with_unsafe_names_is_refused(render_node, client, frame):
+    url, store, frames = render_node
+    with open(store / MANIFEST_FILE) as f:
+        manifest = json.load(f)
+    manifest["frames"][0].update(frame)
+    with open(store / MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError):
+        pull_bundle(url, cache="objects", staging="pulled")
+    assert current_bundle() is None
+    assert not os.path.exists(client.parent / "escaped.png")
@@ -0,0 +1,63 @@
+import os
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from hhcalendar import parse_events, normalize_events, fetch_calendar_html
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+def test_parse_events_keeps_blocks_with_several_classes():
+    events = parse_events(read_fixture("calendar.html"))
+    assert [event["date"] for event in events] == ["3 NOV", "12 NOV", "20 NOV"]
+    assert events[0] == {"title": "Open lecture on wind power", "date": "3 NOV",
+                         "description": "Room O102, free entry."}
+
+def test_normalize_events_collapses_whitespace():
+    events = normalize_events(parse_events(read_fixture("calendar.html")))
+    assert events[1]["title"] == "PhD defence: Embedded systems"
+
+class CalendarPage(BaseHTTPRequestHandler):
+    """Serves the fixture with an ETag and answers a matching If-None-Match with 304."""
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        if_none_match = self.headers.get("If-None-Match")
+        type(self).requests.append(if_none_match)
+        if if_none_match == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+        body = read_fixture("calendar.html").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def calendar_url():
+    CalendarPage.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CalendarPage)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/calendar"
+    server.shutdown()
+
+def test_unchanged_calendar_page_is_answered_from_the_cache(calendar_url, tmp_path):
+    first = fetch_calendar_html(calendar_url, cache_dir=str(tmp_path))
+    second = fetch_calendar_html(calendar_url, cache_dir=str(tmp_path))
+    # The second request asks with the saved ETag and gets no body back
+    assert CalendarPage.requests == [None, CalendarPage.etag]
+    assert second == first == read_fixture("calendar.html")
+    assert [event["date"] for event in parse_events(second)] == ["3 NOV", "12 NOV", "20 NOV"]
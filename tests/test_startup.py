@@ -0,0 +1,15 @@
+import os
+import sys
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("PIL", "requests", "selenium", "bs4", "pynput")
+
+def test_importing_main_loads_no_heavy_packages():
+    # -X importtime lists every module the import pulled in, on stderr
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    loaded = {line.split("|")[-1].strip().split(".")[0]
+              for line in result.stderr.splitlines() if line.startswith("import time:")}
+    assert loaded, "no -X importtime output"
+    assert not loaded.intersection(HEAVY_MODULES)
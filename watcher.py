@@ -0,0 +1,82 @@
+import os
+import time
+import select
+import ctypes
+import ctypes.util
+
+# inotify flags from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+_libc = _load_libc()
+
+class DirectoryWatcher:
+    """Sleep until something changes in a directory.
+
+    Uses inotify on Linux so a waiter wakes as soon as a file is created,
+    renamed or finished writing. Elsewhere it degrades to a short poll.
+    """
+
+    def __init__(self, path, poll_interval=1.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.fd = None
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0 and _libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK) >= 0:
+                self.fd = fd
+            elif fd >= 0:
+                os.close(fd)
+
+    def wait(self, timeout):
+        """Block for up to timeout seconds, return True if an event arrived."""
+        if self.fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return False
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return False
+        # Drain the queue, callers re-check the directory themselves
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def wait_until(condition, watcher, timeout):
+    """Re-check condition on every directory event until it holds or timeout passes."""
+    end_time = time.time() + timeout
+    while True:
+        if condition():
+            return True
+        remaining = end_time - time.time()
+        if remaining <= 0:
+            return False
+        watcher.wait(remaining)